@@ -0,0 +1,334 @@
+import atexit
+import heapq
+import itertools
+import json
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+
+DEAD_LETTER_PATH = 'alerts_dead_letter.jsonl'
+_STOP = object()
+
+
+class TwilioTransport:
+    """Sends alerts as SMS through a twilio.rest.Client"""
+
+    name = 'twilio'
+
+    def __init__(self, client, from_number):
+        self.client = client
+        self.from_number = from_number
+
+    def send(self, to, body):
+        self.client.messages.create(body=body, from_=self.from_number, to=to)
+
+
+class FakeTransport:
+    """Local stand-in for an SMS API, for tests and benchmarks.
+
+    Each send sleeps for `latency` seconds (plus up to `jitter`) and fails
+    with probability `failure_rate`; delivered messages are kept in `sent`.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, to, body):
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fail = self.random.random() < self.failure_rate
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("simulated delivery failure")
+        with self.lock:
+            self.sent.append((to, body, time.time()))
+
+
+class Alert:
+    def __init__(self, to, body):
+        self.to = to
+        self.body = body
+        self.created = time.time()
+        self.attempts = 0
+        self.last_error = None
+
+
+class AlertDispatcher:
+    """Delivers alerts off the frame-processing path.
+
+    `submit()` only puts the alert on a bounded queue and returns; a pool of
+    `workers` threads hands alerts to the `transport`. A failed send is
+    retried after an exponential backoff (`base_delay` doubling up to
+    `max_delay`, with jitter) until `max_attempts`, then written to the
+    dead-letter file as a JSON line. Alerts that do not fit in the queue are
+    dead-lettered straight away rather than blocking the caller.
+    """
+
+    def __init__(self, transport, workers=2, max_queue=1000, max_attempts=5, base_delay=1.0, max_delay=60.0,
+                 dead_letter_path=DEAD_LETTER_PATH):
+        self.transport = transport
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dead_letter_path = dead_letter_path
+        self.alerts = queue.Queue(maxsize=max_queue)
+        # (due time, sequence, alert) waiting for their next attempt
+        self.retries = []
+        self.retry_condition = threading.Condition()
+        self.counters = {'submitted': 0, 'sent': 0, 'retried': 0, 'dead_lettered': 0, 'rejected': 0}
+        self.delivery_seconds = 0.0
+        self.lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._threads = None
+        self._closing = False
+
+    def start(self):
+        with self.lock:
+            if self._threads is not None:
+                return
+            self._threads = [threading.Thread(target=self._run_worker, name=f"alert-worker-{i}", daemon=True)
+                             for i in range(self.workers)]
+            self._threads.append(threading.Thread(target=self._run_retries, name="alert-retries", daemon=True))
+            for thread in self._threads:
+                thread.start()
+            atexit.register(self.close)
+
+    def submit(self, to, body):
+        """Queue an alert for delivery; returns False if it had to be dead-lettered"""
+        self.start()
+        alert = Alert(to, body)
+        with self.lock:
+            self.counters['submitted'] += 1
+        try:
+            self.alerts.put_nowait(alert)
+            return True
+        except queue.Full:
+            with self.lock:
+                self.counters['rejected'] += 1
+            self._dead_letter(alert, "alert queue full")
+            return False
+
+    def _run_worker(self):
+        while True:
+            alert = self.alerts.get()
+            if alert is _STOP:
+                break
+            self._deliver(alert)
+
+    def _deliver(self, alert):
+        alert.attempts += 1
+        try:
+            self.transport.send(alert.to, alert.body)
+        except Exception as e:
+            alert.last_error = str(e)
+            if alert.attempts >= self.max_attempts or self._closing:
+                print(f"Alert to {alert.to} failed after {alert.attempts} attempts: {e}")
+                self._dead_letter(alert, alert.last_error)
+                return
+            delay = min(self.max_delay, self.base_delay * 2 ** (alert.attempts - 1))
+            delay *= random.uniform(0.5, 1.0)
+            with self.retry_condition:
+                heapq.heappush(self.retries, (time.time() + delay, next(self._sequence), alert))
+                self.retry_condition.notify()
+            with self.lock:
+                self.counters['retried'] += 1
+            return
+        with self.lock:
+            self.counters['sent'] += 1
+            self.delivery_seconds += time.time() - alert.created
+
+    def _run_retries(self):
+        # Moves alerts back onto the queue once their backoff has passed
+        while True:
+            with self.retry_condition:
+                while not self._closing and (not self.retries or self.retries[0][0] > time.time()):
+                    timeout = self.retries[0][0] - time.time() if self.retries else None
+                    self.retry_condition.wait(timeout)
+                if self._closing:
+                    return
+                _, _, alert = heapq.heappop(self.retries)
+            self.alerts.put(alert)
+
+    def _dead_letter(self, alert, reason):
+        with self.lock:
+            self.counters['dead_lettered'] += 1
+            try:
+                with open(self.dead_letter_path, 'a') as f:
+                    f.write(json.dumps({
+                        'to': alert.to,
+                        'body': alert.body,
+                        'attempts': alert.attempts,
+                        'error': reason,
+                        'created': datetime.fromtimestamp(alert.created).isoformat(),
+                        'failed': datetime.now().isoformat(),
+                    }) + "\n")
+            except OSError as e:
+                print(f"Error writing alert dead letter: {e}")
+
+    def close(self):
+        """Deliver what is queued, dead-letter alerts still waiting to retry, stop the workers"""
+        with self.lock:
+            threads, self._threads = self._threads, None
+        if threads is None:
+            return
+        with self.retry_condition:
+            self._closing = True
+            pending = [alert for _, _, alert in self.retries]
+            self.retries = []
+            self.retry_condition.notify_all()
+        for _ in range(self.workers):
+            self.alerts.put(_STOP)
+        for thread in threads[:-1]:
+            thread.join()
+        # Anything the retry thread requeued after the workers stopped
+        while True:
+            try:
+                alert = self.alerts.get_nowait()
+            except queue.Empty:
+                break
+            if alert is not _STOP:
+                pending.append(alert)
+        threads[-1].join()
+        for alert in pending:
+            self._dead_letter(alert, f"shutdown before retry: {alert.last_error}")
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            sent = stats['sent']
+            stats['avg_delivery_ms'] = round(self.delivery_seconds * 1000 / sent, 1) if sent else None
+        stats['queued'] = self.alerts.qsize()
+        stats['waiting_retry'] = len(self.retries)
+        return stats
+
+
+class AlertDigest:
+    """Coalesces bursts of alerts per recipient into one message.
+
+    `add()` buffers an alert for its recipient; the buffer is sent through
+    the dispatcher as a single combined message `window` seconds after its
+    first alert, or as soon as it holds `max_alerts`. Alerts in
+    `priority_categories` bypass the buffer and go out immediately, so the
+    worst-case delay is `window` for everything else and none for them.
+    """
+
+    def __init__(self, dispatcher, window=30.0, max_alerts=10, priority_categories=('criminal',)):
+        self.dispatcher = dispatcher
+        self.window = window
+        self.max_alerts = max_alerts
+        self.priority_categories = set(priority_categories)
+        # recipient -> {'due': time, 'title': str, 'messages': [...], 'lines': [...]}
+        self.pending = {}
+        self.counters = {'alerts': 0, 'bypassed': 0, 'digests': 0}
+        self.condition = threading.Condition()
+        self._thread = None
+        self._closing = False
+
+    def start(self):
+        with self.condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="alert-digest", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def add(self, to, category, message, line, title="ALERT"):
+        """Queue an alert: `message` is its standalone text, `line` its entry in a digest"""
+        self.start()
+        with self.condition:
+            self.counters['alerts'] += 1
+            if category in self.priority_categories:
+                self.counters['bypassed'] += 1
+                flush = None
+            else:
+                digest = self.pending.get(to)
+                if digest is None:
+                    digest = self.pending[to] = {'due': time.time() + self.window, 'title': title,
+                                                 'messages': [], 'lines': []}
+                    self.condition.notify()
+                digest['messages'].append(message)
+                digest['lines'].append(line)
+                flush = self.pending.pop(to) if len(digest['lines']) >= self.max_alerts else None
+        if category in self.priority_categories:
+            self.dispatcher.submit(to, message)
+        elif flush is not None:
+            self._send(to, flush)
+
+    def _send(self, to, digest):
+        if len(digest['lines']) == 1:
+            body = digest['messages'][0]
+        else:
+            body = f"{digest['title']} - {len(digest['lines'])} detections:\n" + "\n".join(digest['lines'])
+        with self.condition:
+            self.counters['digests'] += 1
+        self.dispatcher.submit(to, body)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                now = time.time()
+                due = [to for to, digest in self.pending.items() if digest['due'] <= now or self._closing]
+                if not due:
+                    if self._closing:
+                        return
+                    next_due = min((digest['due'] for digest in self.pending.values()), default=None)
+                    self.condition.wait(None if next_due is None else next_due - now)
+                    continue
+                ready = [(to, self.pending.pop(to)) for to in due]
+            for to, digest in ready:
+                self._send(to, digest)
+
+    def close(self):
+        """Send every buffered digest now, then shut the dispatcher down"""
+        with self.condition:
+            thread, self._thread = self._thread, None
+            self._closing = True
+            self.condition.notify()
+        if thread is not None:
+            thread.join()
+        self.dispatcher.close()
+
+    def stats(self):
+        with self.condition:
+            stats = dict(self.counters)
+            stats['buffered'] = sum(len(digest['lines']) for digest in self.pending.values())
+        return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark alert delivery against the fake transport")
+    parser.add_argument('--alerts', type=int, default=500, help="Alerts to submit")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds per simulated send")
+    parser.add_argument('--failure-rate', type=float, default=0.1, help="Fraction of sends that fail")
+    parser.add_argument('--base-delay', type=float, default=0.1, help="First retry backoff in seconds")
+    args = parser.parse_args()
+
+    transport = FakeTransport(latency=args.latency, failure_rate=args.failure_rate, seed=0)
+    dispatcher = AlertDispatcher(transport, workers=args.workers, max_queue=args.alerts,
+                                 base_delay=args.base_delay, dead_letter_path=DEAD_LETTER_PATH + '.bench')
+    started = time.perf_counter()
+    for i in range(args.alerts):
+        dispatcher.submit('+10000000000', f"benchmark alert {i}")
+    submit_ms = (time.perf_counter() - started) * 1000
+    while True:
+        stats = dispatcher.stats()
+        if stats['sent'] + stats['dead_lettered'] >= args.alerts:
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    dispatcher.close()
+    print(f"submit: {submit_ms / args.alerts:.3f} ms/alert, delivery: {args.alerts / elapsed:.1f} alerts/s")
+    print(stats)
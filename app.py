@@ -1,11 +1,21 @@
-from flask import Flask, render_template, request, redirect, url_for, Response, jsonify, session
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, Response, jsonify, session, send_file, abort
+import os
 import face_recognition
 import numpy as np
 import cv2
-import pickle
 import threading
 from datetime import datetime
+from gallery import FaceGallery
+from sharded_gallery import ShardedGallery
+from db_pool import ConnectionPool
+from face_index import index_factory
+from pipeline import RecognitionPipeline
+from encoding_format import pack_encoding, unpack_encoding
+from detection_log import DetectionWriter, fetch_detections, page_args
+from image_store import ImageStore
+from sightings import SightingAggregator
+from broadcast import FrameBroadcaster
+from stream_ingest import ingest_stream
 
 app = Flask(__name__, template_folder='templates')
 app.secret_key = 'your_secret_key'  # Required for using sessions
@@ -14,13 +24,28 @@ app.secret_key = 'your_secret_key'  # Required for using sessions
 VALID_USERNAME = 'admin'
 VALID_PASSWORD = 'password'
 
-# Database connection helper
-def get_db_connection():
-    return sqlite3.connect('record.db')
+# Pooled database connections: conn.close() hands them back for reuse, and
+# readonly=True gives a read-only connection for dashboard queries
+db_pool = ConnectionPool('record.db')
+
+def get_db_connection(readonly=False):
+    return db_pool.connection(readonly)
+
+# Detection frames are kept on disk keyed by content hash; rows only hold
+# the key. Events are inserted in batches by one background writer thread
+image_store = ImageStore('detection_frames')
+detection_writer = DetectionWriter('record.db', image_store=image_store)
+
+# A sighting closes once its person has not been matched at that location
+# for SIGHTING_GAP_SECONDS; open sightings are rewritten every
+# SIGHTING_UPDATE_SECONDS so the logs stay current
+SIGHTING_GAP_SECONDS = 10
+SIGHTING_UPDATE_SECONDS = 30
+sightings = SightingAggregator(detection_writer, gap=SIGHTING_GAP_SECONDS, update_every=SIGHTING_UPDATE_SECONDS)
 
 # Record retrieval function
 def get_detection_records():
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     cursor = conn.cursor()
     cursor.execute('''
         SELECT person_name, category, last_location, time 
@@ -31,39 +56,71 @@ def get_detection_records():
     conn.close()
     return records
 
-def log_detection(name, category, frame, location="Unknown"):
+def log_detection(name, category, frame, location="Unknown", person_id=None, distance=None):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        
-        cursor.execute('''
-            INSERT INTO detection_events (person_name, category, last_location, detected_frame)
-            VALUES (?, ?, ?, ?)
-        ''', (name, category, location, frame_bytes))
-        conn.commit()
-        conn.close()
+        # Repeated matches of the same person at this location extend the
+        # open sighting; only a new sighting is written and alerted on
+        if not sightings.observe(person_id, name, category, location, frame, distance):
+            return
         print(f"ALERT: {category} detected - {name} at {location}")
     except Exception as e:
         print(f"Error logging detection: {e}")
 
-def get_face_encodings():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT person_id, encoding FROM face_encodings")
-    rows = cursor.fetchall()
-    known_encodings = [pickle.loads(row[1]) for row in rows]
-    known_ids = [row[0] for row in rows]
-    
-    cursor.execute("SELECT id, name, category FROM known_faces")
-    face_rows = cursor.fetchall()
-    face_dict = {row[0]: {'name': row[1], 'category': row[2]} for row in face_rows}
-    conn.close()
-    return known_encodings, known_ids, face_dict
+# Gallery search backend: None for an exact scan, 'ivf' for approximate
+# search on very large watchlists (tune n_lists / n_probe for recall)
+GALLERY_INDEX = None
+GALLERY_INDEX_OPTIONS = {'n_lists': 1024, 'n_probe': 16}
+# Split an exact scan of a large gallery across this many shard processes
+# (0 keeps the whole gallery in this process)
+GALLERY_SHARDS = 0
+# Search a centroid and a few exemplars per person instead of every stored
+# encoding, leaving out outliers such as bystanders (replaces GALLERY_INDEX)
+GALLERY_TEMPLATES = False
+
+if GALLERY_SHARDS:
+    gallery = ShardedGallery('record.db', shards=GALLERY_SHARDS, templates=GALLERY_TEMPLATES)
+else:
+    # In-memory face gallery, mapped from the shared snapshot at startup
+    gallery = FaceGallery('record.db', snapshot_dir='gallery_snapshot',
+                          index_factory=index_factory(GALLERY_INDEX, **GALLERY_INDEX_OPTIONS),
+                          templates=GALLERY_TEMPLATES)
+gallery.load()
+# Enrollments from other processes are picked up in the background
+gallery.start_refresher()
 
-client_frames = {}
+# Latest frame of each camera, encoded once per frame for all viewers;
+# VIEWER_MAX_FPS caps each /video_feed viewer (None for every frame)
+frame_broadcaster = FrameBroadcaster()
+VIEWER_MAX_FPS = 15
+
+# Per-camera recognition settings (see recognition.DEFAULT_CAMERA_SETTINGS);
+# motion gating skips face detection on frames where nothing moved, tracking
+# only re-encodes a face when its track is new or due for re-verification
+CAMERA_SETTINGS = {
+    'default': {'motion_gating': True, 'motion_threshold': 25, 'force_detect_every': 30,
+                'tracking': True, 'reverify_every': 15},
+    # Detect on a downscaled copy of large uploads, ignoring tiny faces:
+    # 'client1': {'motion_threshold': 40, 'detection_scale': 0.5, 'min_face_size': 40},
+}
+
+# Recognition mode: 'sync' recognizes each frame inside the upload request,
+# 'async' queues it for the recognition worker processes and returns at once
+INGEST_MODE = 'sync'
+RECOGNITION_WORKERS = 2
+# Frames waiting per camera and what to drop when recognition falls behind:
+# 'drop_oldest' (latest frame wins), 'drop_newest' or 'keep_every_nth'
+FRAME_QUEUE_DEPTH = 1
+FRAME_DROP_POLICY = 'drop_oldest'
+KEEP_EVERY_NTH = 1
+# Each lane batches frames from its cameras for up to BATCH_MAX_WAIT_MS or
+# BATCH_MAX_FRAMES frames before encoding and matching them together
+BATCH_MAX_FRAMES = 8
+BATCH_MAX_WAIT_MS = 20
+recognition_pipeline = RecognitionPipeline(gallery, log_detection, workers=RECOGNITION_WORKERS,
+                                           queue_depth=FRAME_QUEUE_DEPTH, drop_policy=FRAME_DROP_POLICY,
+                                           every_nth=KEEP_EVERY_NTH, camera_settings=CAMERA_SETTINGS,
+                                           batch_max_frames=BATCH_MAX_FRAMES,
+                                           batch_max_wait=BATCH_MAX_WAIT_MS / 1000.0)
 
 # Login Route
 @app.route('/login', methods=['GET', 'POST'])
@@ -109,6 +166,8 @@ def add_record():
         # Insert person details into the database
         conn = get_db_connection()
         cursor = conn.cursor()
+        person_id = None
+        new_encodings = []
         try:
             cursor.execute('''
             INSERT INTO known_faces (name, age, city, category, details) 
@@ -128,8 +187,9 @@ def add_record():
                         cursor.execute('''
                         INSERT INTO face_encodings (person_id, encoding) 
                         VALUES (?, ?)
-                        ''', (person_id, pickle.dumps(encoding)))  # Store the encoding as a binary pickle
+                        ''', (person_id, pack_encoding(encoding)))  # Store the encoding in the packed binary format
                         encoding_added = True
+                        new_encodings.append(encoding)
                 except Exception as e:
                     print(f"Error processing image {image_file.filename}: {e}")
             
@@ -140,6 +200,9 @@ def add_record():
         finally:
             conn.commit()
             conn.close()
+
+        if person_id is not None:
+            gallery.add_person(person_id, name, category, new_encodings)
         
         return redirect(url_for('home'))  # Redirect to home after adding the record
     
@@ -152,24 +215,45 @@ def live_feed():
 
 @app.route('/detection_logs')
 def detection_logs():
-    # Fetch detection logs from the database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT person_name, category, last_location, time, detected_frame 
-        FROM detection_events 
-        ORDER BY time DESC
-    ''')
-    logs = cursor.fetchall()
-    conn.close()
-    
+    # One page of detection logs, newest first, optionally filtered by
+    # person, category or location
+    filters = page_args(request.args)
+    conn = get_db_connection(readonly=True)
+    try:
+        logs, next_cursor = fetch_detections(conn, **filters)
+    except ValueError:
+        abort(400)
+    finally:
+        conn.close()
+
     # Render the logs page
-    return render_template('detection_logs.html', logs=logs)
+    return render_template('detection_logs.html', logs=logs, next_cursor=next_cursor, filters=filters)
+
+@app.route('/api/detections')
+def api_detections():
+    # Same listing as JSON; pass next_cursor back as ?cursor= for the next page
+    conn = get_db_connection(readonly=True)
+    try:
+        logs, next_cursor = fetch_detections(conn, **page_args(request.args))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        conn.close()
+
+    return jsonify({"detections": logs, "next_cursor": next_cursor})
+
+@app.route('/detection_frame/<key>')
+def detection_frame(key):
+    # Captured frame of a detection, served from the image store; keys are
+    # content hashes, so the image behind a key never changes
+    if not image_store.exists(key):
+        abort(404)
+    return send_file(os.path.abspath(image_store.path(key)), mimetype='image/jpeg', max_age=31536000)
 
 
 @app.route('/view_records')
 def view_records():
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     cursor = conn.cursor()
 
     # Fetch known faces and their corresponding encodings from the database
@@ -187,7 +271,7 @@ def view_records():
     for data in known_faces_data:
         person_id, name, age, city, category, details, encoding_binary = data
         if encoding_binary:
-            encoding = pickle.loads(encoding_binary).tolist()  # Convert to list
+            encoding = unpack_encoding(encoding_binary).tolist()  # Convert to list
         else:
             encoding = None
         known_faces.append({
@@ -202,54 +286,76 @@ def view_records():
     # Render the page with known faces and their encodings
     return render_template('view_records.html', known_faces=known_faces)
 
+@app.route('/reload_gallery', methods=['POST'])
+def reload_gallery():
+    # Pick up out-of-band changes to record.db, rebuilding the snapshot if stale
+    gallery.load()
+    return jsonify({"status": "gallery reloaded", "encodings": len(gallery)})
+
 @app.route('/video_feed/<client_id>')
 def video_feed(client_id):
-    return Response(generate_frame(client_id),
+    # ?max_fps= lowers the frame rate for this viewer
+    max_fps = request.args.get('max_fps', VIEWER_MAX_FPS, type=float)
+    return Response(frame_broadcaster.stream(client_id, max_fps=max_fps),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
-def generate_frame(client_id):
-    while True:
-        if client_id in client_frames:
-            frame = client_frames[client_id]
-            ret, jpeg = cv2.imencode('.jpg', frame)
-            if ret:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n\r\n')
-
-@app.route('/upload_frame/<client_id>', methods=['POST'])
-def upload_frame(client_id):
+def ingest_frame(client_id, data):
+    # Shared by the multipart upload and the streaming ingest endpoint;
+    # returns (payload, status code)
     try:
-        data = request.files['frame'].read()
+        if INGEST_MODE == 'async':
+            # The uploaded JPEG is streamed, queued and logged as is; only
+            # the recognition worker decodes it
+            frame_broadcaster.publish(client_id, jpeg=data)
+            backlog = recognition_pipeline.submit(client_id, data)
+            result = recognition_pipeline.latest(client_id)
+            return {"status": "frame queued" if backlog['accepted'] else "frame dropped",
+                    "detected_info": result['detected_info'] if result else [],
+                    "backlog": backlog}, 200
         nparr = np.frombuffer(data, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        client_frames[client_id] = frame
-        detected_info = process_frame(frame, client_id)
-        return jsonify({"status": "frame processed", "detected_info": detected_info})
+        if frame is None:
+            return {"status": "error", "message": "could not decode frame"}, 400
+
+        frame_broadcaster.publish(client_id, frame, jpeg=data)
+        detected_info = process_frame(frame, client_id, data)
+        return {"status": "frame processed", "detected_info": detected_info}, 200
     except Exception as e:
         print(f"Error processing frame: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
-def process_frame(frame, location="Unknown"):
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    face_locations = face_recognition.face_locations(rgb_frame)
-    face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-    
-    known_encodings, known_ids, face_dict = get_face_encodings()
-    detected_info = []
-    
-    for face_encoding in face_encodings:
-        matches = face_recognition.compare_faces(known_encodings, face_encoding)
-        if True in matches:
-            first_match_index = matches.index(True)
-            person_id = known_ids[first_match_index]
-            person_info = face_dict[person_id]
-            name = person_info['name']
-            category = person_info['category']
-            detected_info.append({'name': name, 'category': category})
-            log_detection(name, category, frame, location)
-    
-    return detected_info
+@app.route('/upload_frame/<client_id>', methods=['POST'])
+def upload_frame(client_id):
+    payload, status = ingest_frame(client_id, request.files['frame'].read())
+    return jsonify(payload), status
+
+@app.route('/ingest/<client_id>', methods=['POST'])
+def ingest(client_id):
+    # Persistent ingest connection: the request body is a chunked stream of
+    # length-prefixed JPEGs (see stream_ingest.py / stream_client.py) and
+    # every frame's result is written back as one JSON line
+    return Response(ingest_stream(request.stream, client_id, ingest_frame), mimetype='application/x-ndjson')
+
+@app.route('/detections/<client_id>')
+def detections(client_id):
+    # Latest asynchronous recognition result for one camera
+    result = recognition_pipeline.latest(client_id)
+    if result is None:
+        return jsonify({"status": "no frames processed", "detected_info": []})
+    return jsonify({"status": "frame processed", **result,
+                    "backlog": recognition_pipeline.backlog(client_id)})
+
+@app.route('/pipeline_stats')
+def pipeline_stats():
+    # Batch sizes, batching waits and throughput of the recognition lanes
+    return jsonify({**recognition_pipeline.stats(), 'streams': frame_broadcaster.stats(),
+                    'gallery': gallery.stats() if GALLERY_SHARDS else None})
+
+def process_frame(frame, location="Unknown", jpeg_bytes=None):
+    # Motion gating, detection, encoding, gallery matching and logging all
+    # run through the same pipeline the async workers use; detections are
+    # logged with the uploaded JPEG when given instead of re-encoding
+    return recognition_pipeline.process(location, frame, jpeg_bytes)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
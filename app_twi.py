@@ -1,12 +1,25 @@
-from flask import Flask, render_template, request, redirect, url_for, Response, jsonify, session
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, Response, jsonify, session, send_file, abort
+import os
 import face_recognition
 import numpy as np
 import cv2
-import pickle
 import threading
 from datetime import datetime, timedelta
+from gallery import FaceGallery
+from sharded_gallery import ShardedGallery
+from db_pool import ConnectionPool
+from face_index import index_factory
+from pipeline import RecognitionPipeline
+from encoding_format import pack_encoding, unpack_encoding
+from detection_log import DetectionWriter, fetch_detections, page_args
+from database import ensure_detection_columns
+from image_store import ImageStore
+from sightings import SightingAggregator
+from broadcast import FrameBroadcaster
+from stream_ingest import ingest_stream
 from twilio.rest import Client
+from alerts import AlertDispatcher, FakeTransport, TwilioTransport
+from cooldown import CooldownStore
 
 app = Flask(__name__, template_folder='templates')
 app.secret_key = 'your_secret_key'  # Required for using sessions
@@ -16,9 +29,14 @@ TWILIO_ACCOUNT_SID = 'your_account_sid'
 TWILIO_AUTH_TOKEN = 'your_auth_token'
 TWILIO_PHONE_NUMBER = 'your_twilio_phone_number'
 SMS_COOLDOWN = timedelta(minutes=5)  # Cooldown period between SMS alerts
+# Overrides of SMS_COOLDOWN per category or per location, e.g. {'Wanted': timedelta(0)}
+CATEGORY_COOLDOWNS = {}
+LOCATION_COOLDOWNS = {}
 
-# Store last notification times
-last_notification_times = {}
+# Last notification times, shared by all worker processes through record.db
+alert_cooldowns = CooldownStore('record.db', default_cooldown=SMS_COOLDOWN.total_seconds(),
+                                category_cooldowns={k: v.total_seconds() for k, v in CATEGORY_COOLDOWNS.items()},
+                                location_cooldowns={k: v.total_seconds() for k, v in LOCATION_COOLDOWNS.items()})
 
 # Hardcoded login credentials
 VALID_USERNAME = 'admin'
@@ -27,6 +45,21 @@ VALID_PASSWORD = 'password'
 # Initialize Twilio client
 twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+# Alerts are delivered by a worker pool with retries so a slow or failing SMS
+# API never stalls frame processing; undeliverable alerts are appended to
+# ALERT_DEAD_LETTER_PATH. ALERT_TRANSPORT = 'fake' swaps in a local stand-in
+ALERT_TRANSPORT = 'twilio'
+ALERT_WORKERS = 2
+ALERT_QUEUE_SIZE = 1000
+ALERT_MAX_ATTEMPTS = 5
+ALERT_DEAD_LETTER_PATH = 'alerts_dead_letter.jsonl'
+if ALERT_TRANSPORT == 'fake':
+    alert_transport = FakeTransport()
+else:
+    alert_transport = TwilioTransport(twilio_client, TWILIO_PHONE_NUMBER)
+alert_dispatcher = AlertDispatcher(alert_transport, workers=ALERT_WORKERS, max_queue=ALERT_QUEUE_SIZE,
+                                   max_attempts=ALERT_MAX_ATTEMPTS, dead_letter_path=ALERT_DEAD_LETTER_PATH)
+
 # Configure notification recipients based on categories
 NOTIFICATION_RECIPIENTS = {
     'Missing': '+1234567890',  # Phone number for missing person alerts
@@ -39,64 +72,106 @@ def send_sms_alert(category, name, location):
     current_time = datetime.now()
     notification_key = f"{category}_{name}"
     
-    # Check cooldown period
-    if notification_key in last_notification_times:
-        if current_time - last_notification_times[notification_key] < SMS_COOLDOWN:
+    if category in NOTIFICATION_RECIPIENTS:
+        # Check cooldown period; passing the check starts a new one
+        if not alert_cooldowns.should_alert(notification_key, category=category, location=location):
             print(f"Skipping SMS for {name} ({category}) - within cooldown period")
             return
-    
-    if category in NOTIFICATION_RECIPIENTS:
+
         try:
             message = f"ALERT: {category} person detected - {name} at {location} on {current_time.strftime('%Y-%m-%d %H:%M:%S')}"
-            twilio_client.messages.create(
-                body=message,
-                from_=TWILIO_PHONE_NUMBER,
-                to=NOTIFICATION_RECIPIENTS[category]
-            )
-            last_notification_times[notification_key] = current_time
-            print(f"SMS alert sent for {name} ({category})")
+            alert_dispatcher.submit(NOTIFICATION_RECIPIENTS[category], message)
+            print(f"SMS alert queued for {name} ({category})")
         except Exception as e:
             print(f"Error sending SMS: {e}")
 
-def get_db_connection():
-    return sqlite3.connect('record.db')
+# Pooled database connections: conn.close() hands them back for reuse, and
+# readonly=True gives a read-only connection for dashboard queries
+db_pool = ConnectionPool('record.db')
+
+def get_db_connection(readonly=False):
+    return db_pool.connection(readonly)
+
+# Detection frames are kept on disk keyed by content hash; rows only hold
+# the key. Events are inserted in batches by one background writer thread
+image_store = ImageStore('detection_frames')
+detection_writer = DetectionWriter('record.db', image_store=image_store)
+
+# A sighting closes once its person has not been matched at that location
+# for SIGHTING_GAP_SECONDS; open sightings are rewritten every
+# SIGHTING_UPDATE_SECONDS so the logs stay current
+SIGHTING_GAP_SECONDS = 10
+SIGHTING_UPDATE_SECONDS = 30
+sightings = SightingAggregator(detection_writer, gap=SIGHTING_GAP_SECONDS, update_every=SIGHTING_UPDATE_SECONDS)
 
-def log_detection(name, category, frame, location="Unknown"):
+def log_detection(name, category, frame, location="Unknown", person_id=None, distance=None):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        
-        cursor.execute('''
-            INSERT INTO detection_events (person_name, category, last_location, detected_frame)
-            VALUES (?, ?, ?, ?)
-        ''', (name, category, location, frame_bytes))
-        conn.commit()
-        conn.close()
-        
-        # Send SMS alert when detection is logged
+        # Repeated matches of the same person at this location extend the
+        # open sighting; only a new sighting is written and alerted on
+        if not sightings.observe(person_id, name, category, location, frame, distance):
+            return
+
+        # Send SMS alert when a new sighting opens
         send_sms_alert(category, name, location)
         print(f"ALERT: {category} detected - {name} at {location}")
     except Exception as e:
         print(f"Error logging detection: {e}")
 
-def get_face_encodings():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT person_id, encoding FROM face_encodings")
-    rows = cursor.fetchall()
-    known_encodings = [pickle.loads(row[1]) for row in rows]
-    known_ids = [row[0] for row in rows]
-    
-    cursor.execute("SELECT id, name, category FROM known_faces")
-    face_rows = cursor.fetchall()
-    face_dict = {row[0]: {'name': row[1], 'category': row[2]} for row in face_rows}
-    conn.close()
-    return known_encodings, known_ids, face_dict
+# Gallery search backend: None for an exact scan, 'ivf' for approximate
+# search on very large watchlists (tune n_lists / n_probe for recall)
+GALLERY_INDEX = None
+GALLERY_INDEX_OPTIONS = {'n_lists': 1024, 'n_probe': 16}
+# Split an exact scan of a large gallery across this many shard processes
+# (0 keeps the whole gallery in this process)
+GALLERY_SHARDS = 0
+# Search a centroid and a few exemplars per person instead of every stored
+# encoding, leaving out outliers such as bystanders (replaces GALLERY_INDEX)
+GALLERY_TEMPLATES = False
+
+if GALLERY_SHARDS:
+    gallery = ShardedGallery('record.db', shards=GALLERY_SHARDS, templates=GALLERY_TEMPLATES)
+else:
+    # In-memory face gallery, mapped from the shared snapshot at startup
+    gallery = FaceGallery('record.db', snapshot_dir='gallery_snapshot',
+                          index_factory=index_factory(GALLERY_INDEX, **GALLERY_INDEX_OPTIONS),
+                          templates=GALLERY_TEMPLATES)
+gallery.load()
+# Enrollments from other processes are picked up in the background
+gallery.start_refresher()
+
+# Latest frame of each camera, encoded once per frame for all viewers;
+# VIEWER_MAX_FPS caps each /video_feed viewer (None for every frame)
+frame_broadcaster = FrameBroadcaster()
+VIEWER_MAX_FPS = 15
 
-client_frames = {}
+# Per-camera recognition settings (see recognition.DEFAULT_CAMERA_SETTINGS);
+# motion gating skips face detection on frames where nothing moved, tracking
+# only re-encodes a face when its track is new or due for re-verification
+CAMERA_SETTINGS = {
+    'default': {'motion_gating': True, 'motion_threshold': 25, 'force_detect_every': 30,
+                'tracking': True, 'reverify_every': 15},
+    # Detect on a downscaled copy of large uploads, ignoring tiny faces:
+    # 'client1': {'motion_threshold': 40, 'detection_scale': 0.5, 'min_face_size': 40},
+}
+
+# Recognition mode: 'sync' recognizes each frame inside the upload request,
+# 'async' queues it for the recognition worker processes and returns at once
+INGEST_MODE = 'sync'
+RECOGNITION_WORKERS = 2
+# Frames waiting per camera and what to drop when recognition falls behind:
+# 'drop_oldest' (latest frame wins), 'drop_newest' or 'keep_every_nth'
+FRAME_QUEUE_DEPTH = 1
+FRAME_DROP_POLICY = 'drop_oldest'
+KEEP_EVERY_NTH = 1
+# Each lane batches frames from its cameras for up to BATCH_MAX_WAIT_MS or
+# BATCH_MAX_FRAMES frames before encoding and matching them together
+BATCH_MAX_FRAMES = 8
+BATCH_MAX_WAIT_MS = 20
+recognition_pipeline = RecognitionPipeline(gallery, log_detection, workers=RECOGNITION_WORKERS,
+                                           queue_depth=FRAME_QUEUE_DEPTH, drop_policy=FRAME_DROP_POLICY,
+                                           every_nth=KEEP_EVERY_NTH, camera_settings=CAMERA_SETTINGS,
+                                           batch_max_frames=BATCH_MAX_FRAMES,
+                                           batch_max_wait=BATCH_MAX_WAIT_MS / 1000.0)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -136,6 +211,8 @@ def add_record():
         
         conn = get_db_connection()
         cursor = conn.cursor()
+        person_id = None
+        new_encodings = []
         try:
             cursor.execute('''
             INSERT INTO known_faces (name, age, city, category, details) 
@@ -153,8 +230,9 @@ def add_record():
                         cursor.execute('''
                         INSERT INTO face_encodings (person_id, encoding) 
                         VALUES (?, ?)
-                        ''', (person_id, pickle.dumps(encoding)))
+                        ''', (person_id, pack_encoding(encoding)))
                         encoding_added = True
+                        new_encodings.append(encoding)
                 except Exception as e:
                     print(f"Error processing image {image_file.filename}: {e}")
             
@@ -165,6 +243,9 @@ def add_record():
         finally:
             conn.commit()
             conn.close()
+
+        if person_id is not None:
+            gallery.add_person(person_id, name, category, new_encodings)
         
         return redirect(url_for('home'))
     
@@ -176,21 +257,44 @@ def live_feed():
 
 @app.route('/detection_logs')
 def detection_logs():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT person_name, category, last_location, time, detected_frame 
-        FROM detection_events 
-        ORDER BY time DESC
-    ''')
-    logs = cursor.fetchall()
-    conn.close()
-    
-    return render_template('detection_logs.html', logs=logs)
+    # One page of detection logs, newest first, optionally filtered by
+    # person, category or location
+    filters = page_args(request.args)
+    conn = get_db_connection(readonly=True)
+    try:
+        logs, next_cursor = fetch_detections(conn, **filters)
+    except ValueError:
+        abort(400)
+    finally:
+        conn.close()
+
+    # Render the logs page
+    return render_template('detection_logs.html', logs=logs, next_cursor=next_cursor, filters=filters)
+
+@app.route('/api/detections')
+def api_detections():
+    # Same listing as JSON; pass next_cursor back as ?cursor= for the next page
+    conn = get_db_connection(readonly=True)
+    try:
+        logs, next_cursor = fetch_detections(conn, **page_args(request.args))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        conn.close()
+
+    return jsonify({"detections": logs, "next_cursor": next_cursor})
+
+@app.route('/detection_frame/<key>')
+def detection_frame(key):
+    # Captured frame of a detection, served from the image store; keys are
+    # content hashes, so the image behind a key never changes
+    if not image_store.exists(key):
+        abort(404)
+    return send_file(os.path.abspath(image_store.path(key)), mimetype='image/jpeg', max_age=31536000)
 
 @app.route('/view_records')
 def view_records():
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -206,7 +310,7 @@ def view_records():
     for data in known_faces_data:
         person_id, name, age, city, category, details, encoding_binary = data
         if encoding_binary:
-            encoding = pickle.loads(encoding_binary).tolist()
+            encoding = unpack_encoding(encoding_binary).tolist()
         else:
             encoding = None
         known_faces.append({
@@ -220,54 +324,81 @@ def view_records():
     
     return render_template('view_records.html', known_faces=known_faces)
 
+@app.route('/reload_gallery', methods=['POST'])
+def reload_gallery():
+    # Pick up out-of-band changes to record.db, rebuilding the snapshot if stale
+    gallery.load()
+    return jsonify({"status": "gallery reloaded", "encodings": len(gallery)})
+
 @app.route('/video_feed/<client_id>')
 def video_feed(client_id):
-    return Response(generate_frame(client_id),
+    # ?max_fps= lowers the frame rate for this viewer
+    max_fps = request.args.get('max_fps', VIEWER_MAX_FPS, type=float)
+    return Response(frame_broadcaster.stream(client_id, max_fps=max_fps),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
-def generate_frame(client_id):
-    while True:
-        if client_id in client_frames:
-            frame = client_frames[client_id]
-            ret, jpeg = cv2.imencode('.jpg', frame)
-            if ret:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n\r\n')
-
-@app.route('/upload_frame/<client_id>', methods=['POST'])
-def upload_frame(client_id):
+def ingest_frame(client_id, data):
+    # Shared by the multipart upload and the streaming ingest endpoint;
+    # returns (payload, status code)
     try:
-        data = request.files['frame'].read()
+        if INGEST_MODE == 'async':
+            # The uploaded JPEG is streamed, queued and logged as is; only
+            # the recognition worker decodes it
+            frame_broadcaster.publish(client_id, jpeg=data)
+            backlog = recognition_pipeline.submit(client_id, data)
+            result = recognition_pipeline.latest(client_id)
+            return {"status": "frame queued" if backlog['accepted'] else "frame dropped",
+                    "detected_info": result['detected_info'] if result else [],
+                    "backlog": backlog}, 200
         nparr = np.frombuffer(data, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        client_frames[client_id] = frame
-        detected_info = process_frame(frame, client_id)
-        return jsonify({"status": "frame processed", "detected_info": detected_info})
+        if frame is None:
+            return {"status": "error", "message": "could not decode frame"}, 400
+
+        frame_broadcaster.publish(client_id, frame, jpeg=data)
+        detected_info = process_frame(frame, client_id, data)
+        return {"status": "frame processed", "detected_info": detected_info}, 200
     except Exception as e:
         print(f"Error processing frame: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return {"status": "error", "message": str(e)}, 500
 
-def process_frame(frame, location="Unknown"):
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    face_locations = face_recognition.face_locations(rgb_frame)
-    face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-    
-    known_encodings, known_ids, face_dict = get_face_encodings()
-    detected_info = []
-    
-    for face_encoding in face_encodings:
-        matches = face_recognition.compare_faces(known_encodings, face_encoding)
-        if True in matches:
-            first_match_index = matches.index(True)
-            person_id = known_ids[first_match_index]
-            person_info = face_dict[person_id]
-            name = person_info['name']
-            category = person_info['category']
-            detected_info.append({'name': name, 'category': category})
-            log_detection(name, category, frame, location)
-    
-    return detected_info
+@app.route('/upload_frame/<client_id>', methods=['POST'])
+def upload_frame(client_id):
+    payload, status = ingest_frame(client_id, request.files['frame'].read())
+    return jsonify(payload), status
+
+@app.route('/ingest/<client_id>', methods=['POST'])
+def ingest(client_id):
+    # Persistent ingest connection: the request body is a chunked stream of
+    # length-prefixed JPEGs (see stream_ingest.py / stream_client.py) and
+    # every frame's result is written back as one JSON line
+    return Response(ingest_stream(request.stream, client_id, ingest_frame), mimetype='application/x-ndjson')
+
+@app.route('/detections/<client_id>')
+def detections(client_id):
+    # Latest asynchronous recognition result for one camera
+    result = recognition_pipeline.latest(client_id)
+    if result is None:
+        return jsonify({"status": "no frames processed", "detected_info": []})
+    return jsonify({"status": "frame processed", **result,
+                    "backlog": recognition_pipeline.backlog(client_id)})
+
+@app.route('/pipeline_stats')
+def pipeline_stats():
+    # Batch sizes, batching waits and throughput of the recognition lanes
+    return jsonify({**recognition_pipeline.stats(), 'streams': frame_broadcaster.stats(),
+                    'gallery': gallery.stats() if GALLERY_SHARDS else None})
+
+@app.route('/alert_stats')
+def alert_stats():
+    # Alert delivery counters: sent, retried, dead-lettered and queued
+    return jsonify(alert_dispatcher.stats())
+
+def process_frame(frame, location="Unknown", jpeg_bytes=None):
+    # Motion gating, detection, encoding, gallery matching and logging all
+    # run through the same pipeline the async workers use; detections are
+    # logged with the uploaded JPEG when given instead of re-encoding
+    return recognition_pipeline.process(location, frame, jpeg_bytes)
 
 if __name__ == '__main__':
     # Create the required database tables if they don't exist
@@ -301,12 +432,19 @@ if __name__ == '__main__':
         person_name TEXT,
         category TEXT,
         last_location TEXT,
-        time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        detected_frame BLOB
+        time DATETIME DEFAULT (DATETIME('now', 'localtime')),
+        detected_frame BLOB,
+        frame_key TEXT,
+        person_id INTEGER,
+        last_seen TIMESTAMP,
+        frame_count INTEGER NOT NULL DEFAULT 1,
+        best_distance REAL
     )
     ''')
+    ensure_detection_columns(cursor)
 
     conn.commit()
     conn.close()
+    gallery.load()
 
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
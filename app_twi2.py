@@ -1,12 +1,24 @@
-from flask import Flask, render_template, request, redirect, url_for, Response, jsonify, session
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, Response, jsonify, session, send_file, abort
+import os
 import face_recognition
 import numpy as np
 import cv2
-import pickle
 import threading
 from datetime import datetime, timedelta
+from gallery import FaceGallery
+from sharded_gallery import ShardedGallery
+from db_pool import ConnectionPool
+from face_index import index_factory
+from pipeline import RecognitionPipeline
+from encoding_format import pack_encoding
+from detection_log import DetectionWriter, fetch_detections, page_args
+from image_store import ImageStore
+from sightings import SightingAggregator
+from broadcast import FrameBroadcaster
+from stream_ingest import ingest_stream
 from twilio.rest import Client
+from alerts import AlertDigest, AlertDispatcher, FakeTransport, TwilioTransport
+from cooldown import CooldownStore
 
 app = Flask(__name__, template_folder='templates')
 app.secret_key = 'your_secret_key'
@@ -23,9 +35,16 @@ LOCATION_CONTACTS = {
     'location3': '+910000113491'
 }
 
-# Notification settings
+# Notification settings; SMS_COOLDOWN can be overridden per category or per
+# location, e.g. LOCATION_COOLDOWNS = {'location1': timedelta(minutes=1)}
 SMS_COOLDOWN = timedelta(minutes=5)
-last_notification_times = {}
+CATEGORY_COOLDOWNS = {}
+LOCATION_COOLDOWNS = {}
+
+# Last notification times, shared by all worker processes through record.db
+alert_cooldowns = CooldownStore('record.db', default_cooldown=SMS_COOLDOWN.total_seconds(),
+                                category_cooldowns={k: v.total_seconds() for k, v in CATEGORY_COOLDOWNS.items()},
+                                location_cooldowns={k: v.total_seconds() for k, v in LOCATION_COOLDOWNS.items()})
 
 # Admin credentials
 ADMIN_USERNAME = 'admin'
@@ -34,24 +53,88 @@ ADMIN_PASSWORD = 'password'
 # Initialize Twilio client
 twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
-# Store frames from different locations
-client_frames = {}
+# Alerts are delivered by a worker pool with retries so a slow or failing SMS
+# API never stalls frame processing; undeliverable alerts are appended to
+# ALERT_DEAD_LETTER_PATH. ALERT_TRANSPORT = 'fake' swaps in a local stand-in
+ALERT_TRANSPORT = 'twilio'
+ALERT_WORKERS = 2
+ALERT_QUEUE_SIZE = 1000
+ALERT_MAX_ATTEMPTS = 5
+ALERT_DEAD_LETTER_PATH = 'alerts_dead_letter.jsonl'
+if ALERT_TRANSPORT == 'fake':
+    alert_transport = FakeTransport()
+else:
+    alert_transport = TwilioTransport(twilio_client, TWILIO_PHONE_NUMBER)
+alert_dispatcher = AlertDispatcher(alert_transport, workers=ALERT_WORKERS, max_queue=ALERT_QUEUE_SIZE,
+                                   max_attempts=ALERT_MAX_ATTEMPTS, dead_letter_path=ALERT_DEAD_LETTER_PATH)
+
+# Digest mode buffers alerts per contact for ALERT_DIGEST_WINDOW and sends
+# one combined SMS (sooner once ALERT_DIGEST_MAX alerts are waiting);
+# PRIORITY_CATEGORIES are always sent immediately
+ALERT_DIGEST = False
+ALERT_DIGEST_WINDOW = timedelta(seconds=30)
+ALERT_DIGEST_MAX = 10
+PRIORITY_CATEGORIES = ('criminal',)
+alert_digest = AlertDigest(alert_dispatcher, window=ALERT_DIGEST_WINDOW.total_seconds(),
+                           max_alerts=ALERT_DIGEST_MAX, priority_categories=PRIORITY_CATEGORIES)
+
+# Latest frame of each location, encoded once per frame for all viewers;
+# VIEWER_MAX_FPS caps each /video_feed viewer (None for every frame)
+frame_broadcaster = FrameBroadcaster()
+VIEWER_MAX_FPS = 15
+
+# Gallery search backend: None for an exact scan, 'ivf' for approximate
+# search on very large watchlists (tune n_lists / n_probe for recall)
+GALLERY_INDEX = None
+GALLERY_INDEX_OPTIONS = {'n_lists': 1024, 'n_probe': 16}
+# Split an exact scan of a large gallery across this many shard processes
+# (0 keeps the whole gallery in this process)
+GALLERY_SHARDS = 0
+# Search a centroid and a few exemplars per person instead of every stored
+# encoding, leaving out outliers such as bystanders (replaces GALLERY_INDEX)
+GALLERY_TEMPLATES = False
+
+if GALLERY_SHARDS:
+    gallery = ShardedGallery('record.db', shards=GALLERY_SHARDS, templates=GALLERY_TEMPLATES)
+else:
+    # In-memory face gallery, mapped from the shared snapshot at startup
+    gallery = FaceGallery('record.db', snapshot_dir='gallery_snapshot',
+                          index_factory=index_factory(GALLERY_INDEX, **GALLERY_INDEX_OPTIONS),
+                          templates=GALLERY_TEMPLATES)
+gallery.load()
+# Enrollments from other processes are picked up in the background
+gallery.start_refresher()
 
-def get_db_connection():
-    return sqlite3.connect('record.db')
+# Pooled database connections: conn.close() hands them back for reuse, and
+# readonly=True gives a read-only connection for dashboard queries
+db_pool = ConnectionPool('record.db')
+
+def get_db_connection(readonly=False):
+    return db_pool.connection(readonly)
+
+# Detection frames are kept on disk keyed by content hash; rows only hold
+# the key. Events are inserted in batches by one background writer thread
+image_store = ImageStore('detection_frames')
+detection_writer = DetectionWriter('record.db', image_store=image_store)
+
+# A sighting closes once its person has not been matched at that location
+# for SIGHTING_GAP_SECONDS; open sightings are rewritten every
+# SIGHTING_UPDATE_SECONDS so the logs stay current
+SIGHTING_GAP_SECONDS = 10
+SIGHTING_UPDATE_SECONDS = 30
+sightings = SightingAggregator(detection_writer, gap=SIGHTING_GAP_SECONDS, update_every=SIGHTING_UPDATE_SECONDS)
 
 def send_sms_alert(name, category, location):
     """Send SMS alert to location-specific contact"""
     current_time = datetime.now()
     notification_key = f"{location}_{name}"
     
-    # Check cooldown period
-    if notification_key in last_notification_times:
-        if current_time - last_notification_times[notification_key] < SMS_COOLDOWN:
+    if location in LOCATION_CONTACTS:
+        # Check cooldown period; passing the check starts a new one
+        if not alert_cooldowns.should_alert(notification_key, category=category, location=location):
             print(f"Skipping SMS for {name} at {location} - within cooldown period")
             return False
-    
-    if location in LOCATION_CONTACTS:
+
         try:
             message = (
                 f"⚠️ ALERT at {location}:\n"
@@ -60,38 +143,27 @@ def send_sms_alert(name, category, location):
                 f"Time: {current_time.strftime('%Y-%m-%d %H:%M:%S')}"
             )
             
-            twilio_client.messages.create(
-                body=message,
-                from_=TWILIO_PHONE_NUMBER,
-                to=LOCATION_CONTACTS[location]
-            )
-            
-            last_notification_times[notification_key] = current_time
-            print(f"SMS alert sent to {location} contact for {name}")
+            # Delivered in the background by the alert dispatcher
+            if ALERT_DIGEST:
+                alert_digest.add(LOCATION_CONTACTS[location], category, message,
+                                 f"- {name} ({category}) at {current_time.strftime('%H:%M:%S')}",
+                                 title=f"⚠️ ALERT at {location}")
+            else:
+                alert_dispatcher.submit(LOCATION_CONTACTS[location], message)
+            print(f"SMS alert queued for {location} contact for {name}")
             return True
         except Exception as e:
             print(f"Error sending SMS to {location}: {e}")
     return False
 
-def log_detection(name, category, frame, location):
-    """Log detection event to database and send alert"""
+def log_detection(name, category, frame, location, person_id=None, distance=None):
+    """Record a match as part of a sighting and alert when a new sighting opens"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Convert frame to JPEG for storage
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        
-        # Log detection event
-        cursor.execute('''
-            INSERT INTO detection_events (person_name, category, last_location, detected_frame)
-            VALUES (?, ?, ?, ?)
-        ''', (name, category, location, frame_bytes))
-        
-        conn.commit()
-        conn.close()
-        
+        # Repeated matches of the same person at this location extend the
+        # open sighting instead of writing a row per frame
+        if not sightings.observe(person_id, name, category, location, frame, distance):
+            return False
+
         # Send location-based alert
         send_sms_alert(name, category, location)
         print(f"Detection logged: {name} ({category}) at {location}")
@@ -100,6 +172,35 @@ def log_detection(name, category, frame, location):
         print(f"Error logging detection: {e}")
         return False
 
+# Per-camera recognition settings (see recognition.DEFAULT_CAMERA_SETTINGS);
+# motion gating skips face detection on frames where nothing moved, tracking
+# only re-encodes a face when its track is new or due for re-verification
+CAMERA_SETTINGS = {
+    'default': {'motion_gating': True, 'motion_threshold': 25, 'force_detect_every': 30,
+                'tracking': True, 'reverify_every': 15},
+    # Detect on a downscaled copy of large uploads, ignoring tiny faces:
+    # 'client1': {'motion_threshold': 40, 'detection_scale': 0.5, 'min_face_size': 40},
+}
+
+# Recognition mode: 'sync' recognizes each frame inside the upload request,
+# 'async' queues it for the recognition worker processes and returns at once
+INGEST_MODE = 'sync'
+RECOGNITION_WORKERS = 2
+# Frames waiting per camera and what to drop when recognition falls behind:
+# 'drop_oldest' (latest frame wins), 'drop_newest' or 'keep_every_nth'
+FRAME_QUEUE_DEPTH = 1
+FRAME_DROP_POLICY = 'drop_oldest'
+KEEP_EVERY_NTH = 1
+# Each lane batches frames from its cameras for up to BATCH_MAX_WAIT_MS or
+# BATCH_MAX_FRAMES frames before encoding and matching them together
+BATCH_MAX_FRAMES = 8
+BATCH_MAX_WAIT_MS = 20
+recognition_pipeline = RecognitionPipeline(gallery, log_detection, workers=RECOGNITION_WORKERS,
+                                           queue_depth=FRAME_QUEUE_DEPTH, drop_policy=FRAME_DROP_POLICY,
+                                           every_nth=KEEP_EVERY_NTH, camera_settings=CAMERA_SETTINGS,
+                                           batch_max_frames=BATCH_MAX_FRAMES,
+                                           batch_max_wait=BATCH_MAX_WAIT_MS / 1000.0)
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -144,6 +245,7 @@ def add_record():
                 VALUES (?, ?, ?, ?, ?)
             ''', (name, age, city, category, details))
             person_id = cursor.lastrowid
+            new_encodings = []
             
             # Process face images
             for image in images:
@@ -156,9 +258,11 @@ def add_record():
                         cursor.execute('''
                             INSERT INTO face_encodings (person_id, encoding)
                             VALUES (?, ?)
-                        ''', (person_id, pickle.dumps(encoding)))
+                        ''', (person_id, pack_encoding(encoding)))
+                        new_encodings.append(encoding)
             
             conn.commit()
+            gallery.add_person(person_id, name, category, new_encodings)
             return redirect(url_for('home'))
             
         except Exception as e:
@@ -175,7 +279,7 @@ def view_records():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     cursor = conn.cursor()
     cursor.execute('''
         SELECT name, age, city, category, details
@@ -187,23 +291,54 @@ def view_records():
     
     return render_template('view_records.html', records=records)
 
+@app.route('/reload_gallery', methods=['POST'])
+def reload_gallery():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    gallery.load()
+    return jsonify({'status': 'success', 'encodings': len(gallery)})
+
 @app.route('/detection_logs')
 def detection_logs():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
-        
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT person_name, category, last_location, time, detected_frame
-        FROM detection_events
-        ORDER BY time DESC
-        LIMIT 100
-    ''')
-    logs = cursor.fetchall()
-    conn.close()
-    
-    return render_template('detection_logs.html', logs=logs)
+
+    filters = page_args(request.args)
+    conn = get_db_connection(readonly=True)
+    try:
+        logs, next_cursor = fetch_detections(conn, **filters)
+    except ValueError:
+        abort(400)
+    finally:
+        conn.close()
+
+    return render_template('detection_logs.html', logs=logs, next_cursor=next_cursor, filters=filters)
+
+@app.route('/api/detections')
+def api_detections():
+    """Keyset-paginated detection log; pass next_cursor back as ?cursor="""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'login required'}), 401
+
+    conn = get_db_connection(readonly=True)
+    try:
+        logs, next_cursor = fetch_detections(conn, **page_args(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+
+    return jsonify({'detections': logs, 'next_cursor': next_cursor})
+
+@app.route('/detection_frame/<key>')
+def detection_frame(key):
+    """Captured frame of a detection, served from the image store"""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    if not image_store.exists(key):
+        abort(404)
+    # Content-addressed, so the image behind a key never changes
+    return send_file(os.path.abspath(image_store.path(key)), mimetype='image/jpeg', max_age=31536000)
 
 @app.route('/live_feed')
 def live_feed():
@@ -213,69 +348,85 @@ def live_feed():
 
 @app.route('/video_feed/<location>')
 def video_feed(location):
+    """MJPEG stream of a location; ?max_fps= lowers the frame rate for this viewer"""
+    max_fps = request.args.get('max_fps', VIEWER_MAX_FPS, type=float)
     return Response(
-        generate_frames(location),
+        frame_broadcaster.stream(location, max_fps=max_fps),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
-def generate_frames(location):
-    while True:
-        if location in client_frames:
-            frame = client_frames[location]
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_data = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n')
-
-@app.route('/upload_frame/<location>', methods=['POST'])
-def upload_frame(location):
+def ingest_frame(location, frame_data):
+    """Recognize one uploaded JPEG; returns (payload, status code)"""
     try:
-        # Read and decode frame
-        frame_data = request.files['frame'].read()
+        if INGEST_MODE == 'async':
+            # Hand the JPEG to the recognition workers and return immediately;
+            # it is streamed and logged as uploaded, never decoded here
+            frame_broadcaster.publish(location, jpeg=frame_data)
+            backlog = recognition_pipeline.submit(location, frame_data)
+            result = recognition_pipeline.latest(location)
+            return {
+                'status': 'queued' if backlog['accepted'] else 'dropped',
+                'detections': result['detected_info'] if result else [],
+                'backlog': backlog
+            }, 200
+        
+        # Decode frame
         nparr = np.frombuffer(frame_data, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if frame is None:
+            return {'error': 'could not decode frame'}, 400
         
-        # Store frame for display
-        client_frames[location] = frame
-        
-        # Process frame
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-        
-        # Get known faces from database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT kf.id, kf.name, kf.category, fe.encoding
-            FROM known_faces kf
-            JOIN face_encodings fe ON kf.id = fe.person_id
-        ''')
-        known_faces = cursor.fetchall()
-        conn.close()
+        # Publish frame for display; viewers get the uploaded JPEG as is
+        frame_broadcaster.publish(location, frame, jpeg=frame_data)
         
-        detected_info = []
-        for face_encoding in face_encodings:
-            for person_id, name, category, known_encoding in known_faces:
-                known_encoding = pickle.loads(known_encoding)
-                match = face_recognition.compare_faces([known_encoding], face_encoding, tolerance=0.6)[0]
-                
-                if match:
-                    detected_info.append({
-                        'name': name,
-                        'category': category
-                    })
-                    log_detection(name, category, frame, location)
-                    break
+        # Process frame: motion gating, detection, encoding, matching and
+        # logging (with the uploaded JPEG rather than a re-encode)
+        detected_info = recognition_pipeline.process(location, frame, frame_data)
         
-        return jsonify({
+        return {
             'status': 'success',
             'detections': detected_info
-        })
+        }, 200
         
     except Exception as e:
         print(f"Error processing frame: {e}")
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
+
+@app.route('/upload_frame/<location>', methods=['POST'])
+def upload_frame(location):
+    payload, status = ingest_frame(location, request.files['frame'].read())
+    return jsonify(payload), status
+
+@app.route('/ingest/<location>', methods=['POST'])
+def ingest(location):
+    """Persistent ingest connection for one location.
+
+    The request body is a chunked stream of length-prefixed JPEGs (see
+    stream_ingest.py and stream_client.py); each frame's result is written
+    back on the same connection as one JSON line.
+    """
+    return Response(ingest_stream(request.stream, location, ingest_frame), mimetype='application/x-ndjson')
+
+@app.route('/detections/<location>')
+def detections(location):
+    """Latest asynchronous recognition result for one location"""
+    result = recognition_pipeline.latest(location)
+    if result is None:
+        return jsonify({'status': 'no frames processed', 'detections': []})
+    return jsonify({'status': 'success', 'detections': result['detected_info'],
+                    'latency_ms': result['latency_ms'],
+                    'backlog': recognition_pipeline.backlog(location)})
+
+@app.route('/pipeline_stats')
+def pipeline_stats():
+    """Batch sizes, batching waits and throughput of the recognition lanes"""
+    return jsonify({**recognition_pipeline.stats(), 'streams': frame_broadcaster.stats(),
+                    'gallery': gallery.stats() if GALLERY_SHARDS else None})
+
+@app.route('/alert_stats')
+def alert_stats():
+    """Alert delivery counters: sent, retried, dead-lettered and queued"""
+    return jsonify({**alert_dispatcher.stats(), 'digest': alert_digest.stats()})
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
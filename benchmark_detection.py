@@ -0,0 +1,87 @@
+import argparse
+import csv
+import os
+import time
+import face_recognition
+import numpy as np
+from recognition import detect_faces
+from tracker import box_iou
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_annotations(path):
+    """Read ground-truth boxes from a CSV of filename,top,right,bottom,left rows"""
+    annotations = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            box = tuple(int(row[key]) for key in ('top', 'right', 'bottom', 'left'))
+            annotations.setdefault(row['filename'], []).append(box)
+    return annotations
+
+
+def count_hits(reference, detected, iou_threshold):
+    if not reference or not detected:
+        return 0
+    iou = box_iou(reference, detected)
+    hits = 0
+    used = set()
+    for i in range(len(reference)):
+        for j in np.argsort(-iou[i]):
+            if iou[i, j] < iou_threshold:
+                break
+            if j not in used:
+                used.add(j)
+                hits += 1
+                break
+    return hits
+
+
+def benchmark(image_dir, scales, upsample=1, min_face_size=0, annotations=None, iou_threshold=0.5, repeat=1):
+    """Detection latency and recall per scale over a fixed set of images.
+
+    Recall is measured against the annotations when given, otherwise against
+    full-resolution detection with the same upsample count.
+    """
+    filenames = sorted(name for name in os.listdir(image_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    images = {name: face_recognition.load_image_file(os.path.join(image_dir, name)) for name in filenames}
+
+    if annotations is None:
+        annotations = {name: detect_faces(image, upsample=upsample) for name, image in images.items()}
+    total_faces = sum(len(annotations.get(name, [])) for name in filenames)
+
+    results = []
+    for scale in scales:
+        hits = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for name, image in images.items():
+                detected = detect_faces(image, scale=scale, upsample=upsample, min_face_size=min_face_size)
+                hits += count_hits(annotations.get(name, []), detected, iou_threshold)
+        elapsed = time.perf_counter() - started
+        results.append({
+            'scale': scale,
+            'latency_ms': elapsed * 1000 / max(1, len(images) * repeat),
+            'recall': hits / float(max(1, total_faces * repeat)),
+        })
+    return results, len(images), total_faces
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark face detection latency and recall at several detection scales")
+    parser.add_argument('image_dir', help="Directory of test images")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.35, 0.25])
+    parser.add_argument('--upsample', type=int, default=1, help="face_locations upsample count")
+    parser.add_argument('--min-face-size', type=int, default=0, help="Minimum face size in pixels")
+    parser.add_argument('--annotations', help="CSV of filename,top,right,bottom,left ground-truth boxes")
+    parser.add_argument('--iou', type=float, default=0.5, help="IoU needed to count a face as found")
+    parser.add_argument('--repeat', type=int, default=1, help="Passes over the test set per scale")
+    args = parser.parse_args()
+
+    annotations = load_annotations(args.annotations) if args.annotations else None
+    results, n_images, n_faces = benchmark(args.image_dir, args.scales, args.upsample, args.min_face_size,
+                                           annotations, args.iou, args.repeat)
+    print(f"{n_images} images, {n_faces} reference faces, upsample={args.upsample}")
+    print(f"{'scale':>6}  {'ms/image':>9}  {'recall':>6}")
+    for row in results:
+        print(f"{row['scale']:>6.2f}  {row['latency_ms']:>9.1f}  {row['recall']:>6.3f}")
@@ -0,0 +1,116 @@
+import threading
+import time
+import cv2
+
+BOUNDARY = b'frame'
+
+
+class _Channel:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.frame = None
+        self.jpeg = None
+        self.jpeg_version = 0
+        self.viewers = 0
+        self.encodes = 0
+
+
+class FrameBroadcaster:
+    """Latest frame of each camera, fanned out to any number of MJPEG viewers.
+
+    `publish()` stores a camera's new frame and bumps its version; viewers
+    sleep on the camera's condition variable until the version changes, so
+    an idle camera costs nothing. The JPEG for a version is encoded at most
+    once, by whichever viewer needs it first, and shared by every other
+    viewer (publishing the original JPEG bytes skips encoding entirely). A
+    viewer with `max_fps` skips the frames that arrive faster than that.
+
+    An idle camera still sends each viewer its last frame again every
+    `keepalive` seconds, so the server notices viewers that went away.
+    """
+
+    def __init__(self, keepalive=5.0):
+        self.keepalive = keepalive
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def _channel(self, camera_id):
+        with self.lock:
+            channel = self.channels.get(camera_id)
+            if channel is None:
+                channel = self.channels[camera_id] = _Channel()
+            return channel
+
+    def publish(self, camera_id, frame=None, jpeg=None):
+        """New frame for a camera, as a BGR array, JPEG bytes, or both"""
+        channel = self._channel(camera_id)
+        with channel.condition:
+            channel.version += 1
+            channel.frame = frame
+            channel.jpeg = jpeg
+            channel.jpeg_version = channel.version if jpeg is not None else 0
+            channel.condition.notify_all()
+
+    def latest_frame(self, camera_id):
+        channel = self._channel(camera_id)
+        with channel.condition:
+            return channel.frame
+
+    def _jpeg(self, channel):
+        # Called with the channel's condition held
+        if channel.jpeg_version != channel.version:
+            if channel.frame is None:
+                return None
+            ret, buffer = cv2.imencode('.jpg', channel.frame)
+            if not ret:
+                return None
+            channel.jpeg = buffer.tobytes()
+            channel.jpeg_version = channel.version
+            channel.encodes += 1
+        return channel.jpeg
+
+    def stream(self, camera_id, max_fps=None):
+        """multipart/x-mixed-replace body yielding each new frame of a camera"""
+        channel = self._channel(camera_id)
+        min_interval = 1.0 / max_fps if max_fps else 0.0
+        seen = 0
+        next_send = 0.0
+        jpeg = None
+        with channel.condition:
+            channel.viewers += 1
+        try:
+            while True:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                with channel.condition:
+                    if channel.version == seen:
+                        channel.condition.wait(self.keepalive)
+                    if channel.version != seen:
+                        seen = channel.version
+                        jpeg = self._jpeg(channel) or jpeg
+                        next_send = time.monotonic() + min_interval
+                if jpeg is None:
+                    # Nothing to show yet; a bare line break is still a write
+                    # that fails once the viewer has disconnected
+                    yield b'\r\n'
+                    continue
+                # Either a new frame or, after a keepalive timeout, the last
+                # one again
+                yield (b'--' + BOUNDARY + b'\r\n'
+                       b'Content-Type: image/jpeg\r\n'
+                       b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            with channel.condition:
+                channel.viewers -= 1
+
+    def stats(self):
+        with self.lock:
+            channels = dict(self.channels)
+        stats = {}
+        for camera_id, channel in channels.items():
+            with channel.condition:
+                stats[camera_id] = {'frames': channel.version, 'encodes': channel.encodes,
+                                    'viewers': channel.viewers}
+        return stats
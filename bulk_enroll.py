@@ -0,0 +1,198 @@
+import argparse
+import csv
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+import face_recognition
+from database import ensure_bulk_imports, ensure_gallery_version
+from encoding_format import pack_encoding
+
+DB_PATH = 'record.db'
+CATEGORIES = ('criminal', 'missing person', 'suspect', 'other')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+# Manifest columns; `images` holds one or more paths separated by ';',
+# relative to the manifest's directory
+MANIFEST_COLUMNS = ('name', 'age', 'city', 'category', 'details', 'images')
+
+
+def people_from_directory(root, category='other', age=0, city='Unknown'):
+    """One person per sub-directory of `root`, named after it, with every image below it"""
+    people = []
+    for entry in sorted(os.listdir(root)):
+        person_dir = os.path.join(root, entry)
+        if not os.path.isdir(person_dir):
+            continue
+        images = []
+        for dirpath, dirnames, filenames in os.walk(person_dir):
+            dirnames.sort()
+            images.extend(os.path.join(dirpath, filename) for filename in sorted(filenames)
+                          if filename.lower().endswith(IMAGE_EXTENSIONS))
+        people.append({'source_key': f"dir:{entry}", 'name': entry, 'age': age, 'city': city,
+                       'category': category, 'details': '', 'images': images})
+    return people
+
+
+def people_from_manifest(path):
+    """One person per row of a manifest CSV (see MANIFEST_COLUMNS)"""
+    base = os.path.dirname(os.path.abspath(path))
+    people = []
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        missing = [column for column in MANIFEST_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"manifest is missing columns: {', '.join(missing)}")
+        for row in reader:
+            images = [os.path.join(base, image.strip()) for image in row['images'].split(';') if image.strip()]
+            people.append({'source_key': f"csv:{row['name']}|{row['images']}", 'name': row['name'].strip(),
+                           'age': row['age'], 'city': row['city'], 'category': row['category'].strip(),
+                           'details': row['details'], 'images': images})
+    return people
+
+
+def encode_image(path):
+    """Worker side: (path, packed encoding or None, status, message) for one image.
+
+    Only the largest face is enrolled; archive photos may show bystanders.
+    """
+    try:
+        image = face_recognition.load_image_file(path)
+        locations = face_recognition.face_locations(image)
+        if not locations:
+            return path, None, 'no_face', 'no face found'
+        status, message = 'ok', ''
+        if len(locations) > 1:
+            status, message = 'multiple_faces', f"{len(locations)} faces found, enrolled the largest"
+            locations = [max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))]
+        encoding = face_recognition.face_encodings(image, locations)[0]
+        return path, pack_encoding(encoding), status, message
+    except Exception as e:
+        return path, None, 'error', str(e)
+
+
+def imported_keys(cursor, retry_failed=False):
+    if retry_failed:
+        cursor.execute("SELECT source_key FROM bulk_imports WHERE person_id IS NOT NULL")
+    else:
+        cursor.execute("SELECT source_key FROM bulk_imports")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def write_people(conn, done):
+    """Insert a batch of encoded people and mark them imported, in one transaction"""
+    cursor = conn.cursor()
+    enrolled = 0
+    for person, encodings in done:
+        person_id = None
+        if encodings:
+            cursor.execute('''
+            INSERT INTO known_faces (name, age, city, category, details)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (person['name'], person['age'], person['city'], person['category'], person['details']))
+            person_id = cursor.lastrowid
+            cursor.executemany("INSERT INTO face_encodings (person_id, encoding) VALUES (?, ?)",
+                               [(person_id, encoding) for encoding in encodings])
+            enrolled += 1
+        cursor.execute('''
+        INSERT OR REPLACE INTO bulk_imports (source_key, person_id, images, encodings)
+        VALUES (?, ?, ?, ?)
+        ''', (person['source_key'], person_id, len(person['images']), len(encodings)))
+    conn.commit()
+    return enrolled
+
+
+def bulk_enroll(people, db_path=DB_PATH, workers=None, batch_size=500, report_path=None, retry_failed=False):
+    """Encode every person's images on a process pool and enroll them in batches.
+
+    Images are encoded in parallel in input order; once all of a person's
+    images are back the person joins the pending batch, and every
+    `batch_size` people are written in one transaction together with their
+    bulk_imports rows. People already in bulk_imports are skipped, so after
+    an interruption only the unfinished batch is redone. Every image that
+    was not enrolled cleanly is listed in the report CSV.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    cursor = conn.cursor()
+    ensure_gallery_version(cursor)
+    ensure_bulk_imports(cursor)
+    conn.commit()
+
+    skip = imported_keys(cursor, retry_failed)
+    # A person listed twice in the source is only imported once
+    pending, seen = [], set()
+    for person in people:
+        if person['source_key'] not in skip and person['source_key'] not in seen:
+            seen.add(person['source_key'])
+            pending.append(person)
+    print(f"{len(people) - len(pending)} people already imported, {len(pending)} to go")
+
+    failures = []
+    valid = []
+    for person in pending:
+        if person['category'] not in CATEGORIES:
+            failures.append((person['source_key'], '', 'invalid', f"unknown category {person['category']!r}"))
+        elif not person['images']:
+            failures.append((person['source_key'], '', 'invalid', 'no images'))
+        else:
+            valid.append(person)
+
+    paths = [path for person in valid for path in person['images']]
+    started = time.perf_counter()
+    images = enrolled = 0
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Results come back in submission order, so each person's images
+        # arrive together
+        results = executor.map(encode_image, paths, chunksize=max(1, min(32, len(paths) // (4 * (workers or os.cpu_count() or 1)))))
+        for person in valid:
+            encodings = []
+            for _ in person['images']:
+                path, encoding, status, message = next(results)
+                images += 1
+                if encoding is not None:
+                    encodings.append(encoding)
+                if status != 'ok':
+                    failures.append((person['source_key'], path, status, message))
+            batch.append((person, encodings))
+            if len(batch) >= batch_size:
+                enrolled += write_people(conn, batch)
+                batch = []
+                elapsed = time.perf_counter() - started
+                print(f"{images}/{len(paths)} images, {enrolled} people enrolled ({images / elapsed:.1f} images/s)")
+        if batch:
+            enrolled += write_people(conn, batch)
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Done: {enrolled} people enrolled from {images} images in {elapsed:.1f}s "
+          f"({images / max(elapsed, 1e-9):.1f} images/s), {len(failures)} problems")
+    if report_path and failures:
+        with open(report_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['source', 'image', 'status', 'message'])
+            writer.writerows(failures)
+        print(f"Problems written to {report_path}")
+    return enrolled, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enroll many people at once from a photo directory tree or a manifest CSV")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help="Directory with one sub-directory of photos per person, named after them")
+    source.add_argument('--manifest', help="CSV with columns " + ', '.join(MANIFEST_COLUMNS))
+    parser.add_argument('--db', default=DB_PATH, help="Path to the SQLite database")
+    parser.add_argument('--category', default='other', choices=CATEGORIES, help="Category for --dir imports")
+    parser.add_argument('--age', type=int, default=0, help="Age recorded for --dir imports")
+    parser.add_argument('--city', default='Unknown', help="City recorded for --dir imports")
+    parser.add_argument('--workers', type=int, default=None, help="Encoding processes (default: one per core)")
+    parser.add_argument('--batch-size', type=int, default=500, help="People written per transaction")
+    parser.add_argument('--report', default='bulk_enroll_report.csv', help="CSV listing images that were not enrolled cleanly")
+    parser.add_argument('--retry-failed', action='store_true', help="Retry people for whom no face was found last time")
+    args = parser.parse_args()
+
+    if args.dir:
+        people = people_from_directory(args.dir, args.category, args.age, args.city)
+    else:
+        people = people_from_manifest(args.manifest)
+    bulk_enroll(people, args.db, args.workers, args.batch_size, args.report, args.retry_failed)
@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+import time
+from database import ensure_alert_cooldowns
+
+
+class CooldownStore:
+    """Decides whether an alert may be sent, shared by all worker processes.
+
+    Each alert key (e.g. location and person) gets a row in the
+    alert_cooldowns table holding when its cooldown expires. `should_alert()`
+    is a single upsert on the primary key that only succeeds when no
+    unexpired row exists, so concurrent workers cannot both send the same
+    alert. The cooldown for an alert comes from `location_cooldowns`, then
+    `category_cooldowns`, then `default_cooldown` (all in seconds).
+
+    Expired rows are deleted every `evict_every` seconds, and when the table
+    holds more than `max_entries` keys those closest to expiring go first.
+    """
+
+    def __init__(self, db_path, default_cooldown=300, category_cooldowns=None, location_cooldowns=None,
+                 max_entries=10000, evict_every=60):
+        self.db_path = db_path
+        self.default_cooldown = default_cooldown
+        self.category_cooldowns = category_cooldowns or {}
+        self.location_cooldowns = location_cooldowns or {}
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.local = threading.local()
+        self.next_eviction = 0.0
+        self.lock = threading.Lock()
+        with self._connection() as conn:
+            ensure_alert_cooldowns(conn.cursor())
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def cooldown_for(self, category=None, location=None):
+        if location in self.location_cooldowns:
+            return self.location_cooldowns[location]
+        if category in self.category_cooldowns:
+            return self.category_cooldowns[category]
+        return self.default_cooldown
+
+    def should_alert(self, key, category=None, location=None):
+        """True if `key` is not cooling down, in which case its cooldown starts now"""
+        cooldown = self.cooldown_for(category, location)
+        if cooldown <= 0:
+            return True
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute('''
+                INSERT INTO alert_cooldowns (key, expires_at) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at
+                WHERE alert_cooldowns.expires_at <= ?
+            ''', (key, now + cooldown, now))
+            allowed = cursor.rowcount == 1
+        self._maybe_evict(now)
+        return allowed
+
+    def _maybe_evict(self, now):
+        with self.lock:
+            if now < self.next_eviction:
+                return
+            self.next_eviction = now + self.evict_every
+        self.evict(now)
+
+    def evict(self, now=None):
+        """Delete expired keys and trim the table to `max_entries`"""
+        now = time.time() if now is None else now
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM alert_cooldowns WHERE expires_at <= ?", (now,))
+            excess = conn.execute("SELECT COUNT(*) FROM alert_cooldowns").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute('''
+                    DELETE FROM alert_cooldowns WHERE key IN (
+                        SELECT key FROM alert_cooldowns ORDER BY expires_at LIMIT ?
+                    )
+                ''', (excess,))
+
+    def clear(self, key):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM alert_cooldowns WHERE key = ?", (key,))
@@ -1,7 +1,84 @@
 import sqlite3
 
+GALLERY_VERSION_KEY = 'encodings_version'
+
+def ensure_gallery_version(cursor):
+    # Version counter bumped by triggers whenever enrolled encodings change,
+    # used to detect stale gallery snapshots
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS gallery_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO gallery_meta (key, value) VALUES (?, 0)", (GALLERY_VERSION_KEY,))
+
+    for table, event in [('face_encodings', 'INSERT'), ('face_encodings', 'UPDATE'), ('face_encodings', 'DELETE'),
+                         ('known_faces', 'UPDATE'), ('known_faces', 'DELETE')]:
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS bump_gallery_version_{table}_{event.lower()}
+        AFTER {event} ON {table}
+        BEGIN
+            UPDATE gallery_meta SET value = value + 1 WHERE key = '{GALLERY_VERSION_KEY}';
+        END
+        ''')
+
+def get_gallery_version(cursor):
+    cursor.execute("SELECT value FROM gallery_meta WHERE key = ?", (GALLERY_VERSION_KEY,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def ensure_detection_columns(cursor):
+    # Columns added to detection_events after its first release: frame_key
+    # (frames live in the image store, see image_store.py, and detected_frame
+    # stays empty) and the sighting summary (see sightings.py)
+    cursor.execute("PRAGMA table_info(detection_events)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if not columns:
+        return
+    for column, definition in [('frame_key', 'TEXT'), ('person_id', 'INTEGER'), ('last_seen', 'DATETIME'),
+                               ('frame_count', 'INTEGER NOT NULL DEFAULT 1'), ('best_distance', 'REAL')]:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE detection_events ADD COLUMN {column} {definition}")
+
+def ensure_detection_indexes(cursor):
+    # Composite indexes for the keyset-paginated detection log: newest first,
+    # optionally narrowed to one person, category or location (the rowid id
+    # is implicitly the last column of every index)
+    cursor.execute("DROP INDEX IF EXISTS idx_person_name")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detection_time ON detection_events(time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detection_person_time ON detection_events(person_name, time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detection_category_time ON detection_events(category, time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detection_location_time ON detection_events(last_location, time)")
+
+def ensure_alert_cooldowns(cursor):
+    # Alert suppression shared by every worker process (see cooldown.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS alert_cooldowns (
+        key TEXT PRIMARY KEY,
+        expires_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alert_cooldowns_expires ON alert_cooldowns(expires_at)")
+
+def ensure_bulk_imports(cursor):
+    # People already handled by bulk_enroll.py, keyed by their source entry,
+    # so an interrupted import resumes where it stopped; person_id is NULL
+    # when none of the person's images gave a usable face
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS bulk_imports (
+        source_key TEXT PRIMARY KEY,
+        person_id INTEGER,
+        images INTEGER NOT NULL,
+        encodings INTEGER NOT NULL,
+        imported_at DATETIME DEFAULT (DATETIME('now', 'localtime'))
+    )
+    ''')
+
 def init_db():
     conn = sqlite3.connect('record.db')
+    # Readers never block the detection writer (persists in the database file)
+    conn.execute("PRAGMA journal_mode=WAL")
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -31,13 +108,23 @@ def init_db():
         category TEXT NOT NULL,
         last_location TEXT NOT NULL,
         time DATETIME DEFAULT (DATETIME('now', 'localtime')),
-        detected_frame BLOB NOT NULL
+        detected_frame BLOB NOT NULL,
+        frame_key TEXT,
+        person_id INTEGER,
+        last_seen DATETIME,
+        frame_count INTEGER NOT NULL DEFAULT 1,
+        best_distance REAL
     )
     ''')
+    ensure_detection_columns(cursor)
 
     # Create indexes for faster search
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_person_id ON face_encodings(person_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_person_name ON detection_events(person_name)")
+    ensure_detection_indexes(cursor)
+
+    ensure_gallery_version(cursor)
+    ensure_alert_cooldowns(cursor)
+    ensure_bulk_imports(cursor)
 
     conn.commit()
     conn.close()
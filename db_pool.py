@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+import time
+
+# Applied once when a pooled connection is opened
+CONNECTION_PRAGMAS = {
+    'cache_size': -16000,     # 16 MB page cache per connection
+    'mmap_size': 268435456,   # read pages through a 256 MB memory map
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,     # wait for the writer lock instead of failing
+}
+STATEMENT_CACHE_SIZE = 256
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool"""
+
+    pool = None
+    readonly = False
+    checked_out = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif self.checked_out:
+            self.pool.release(self)
+
+    def discard(self):
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """Keeps SQLite connections open between requests.
+
+    `connection()` returns an idle connection, opening a new one only when
+    none is free, and the caller's usual `conn.close()` returns it to the
+    pool with any uncommitted transaction rolled back. Pragmas are applied
+    once per connection, and each connection keeps its own prepared
+    statement cache, so repeated queries skip both the open and the parse.
+
+    `connection(readonly=True)` comes from a separate set of connections
+    opened with mode=ro, for dashboard queries that must never write. Up
+    to `max_idle` connections of each kind are kept; extra ones are closed
+    when released.
+    """
+
+    def __init__(self, db_path, max_idle=8, pragmas=None, cached_statements=STATEMENT_CACHE_SIZE):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.pragmas = CONNECTION_PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+        self.idle = {False: [], True: []}
+        self.lock = threading.Lock()
+        self.counters = {'opened': 0, 'reused': 0, 'discarded': 0}
+
+    def _open(self, readonly):
+        if readonly:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                                   cached_statements=self.cached_statements, factory=PooledConnection)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   cached_statements=self.cached_statements, factory=PooledConnection)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        conn.readonly = readonly
+        return conn
+
+    def connection(self, readonly=False):
+        with self.lock:
+            idle = self.idle[readonly]
+            conn = idle.pop() if idle else None
+            self.counters['reused' if conn is not None else 'opened'] += 1
+        if conn is None:
+            conn = self._open(readonly)
+        conn.pool = self
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        # A second close() from the caller is then harmless
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            return
+        with self.lock:
+            idle = self.idle[conn.readonly]
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+            self.counters['discarded'] += 1
+        conn.discard()
+
+    def close(self):
+        with self.lock:
+            connections = self.idle[False] + self.idle[True]
+            self.idle = {False: [], True: []}
+        for conn in connections:
+            conn.discard()
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'idle': len(self.idle[False]), 'idle_readonly': len(self.idle[True])}
+
+
+def time_query(connect, sql, params=(), repeat=200):
+    """Average milliseconds to open a connection, run `sql`, fetch it all and close"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn = connect()
+        conn.execute(sql, params).fetchall()
+        conn.close()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare per-query latency of fresh and pooled SQLite connections")
+    parser.add_argument('--db', default='record.db', help="Path to the SQLite database")
+    parser.add_argument('--repeat', type=int, default=200, help="Runs of each query")
+    args = parser.parse_args()
+
+    # Dashboard queries the apps run on every page view
+    queries = {
+        'detection_logs page': ("SELECT id, person_name, category, last_location, time FROM detection_events "
+                                "ORDER BY time DESC, id DESC LIMIT 50", ()),
+        'detection records': ("SELECT person_name, category, last_location, time FROM detection_events "
+                              "ORDER BY time DESC LIMIT 50", ()),
+        'view_records': ("SELECT kf.id, kf.name, kf.age, kf.city, kf.category, kf.details "
+                         "FROM known_faces kf LIMIT 50", ()),
+        'person lookup': ("SELECT name, category FROM known_faces WHERE id = ?", (1,)),
+    }
+    pool = ConnectionPool(args.db)
+    for label, (sql, params) in queries.items():
+        fresh = time_query(lambda: sqlite3.connect(args.db), sql, params, args.repeat)
+        pooled = time_query(pool.connection, sql, params, args.repeat)
+        readonly = time_query(lambda: pool.connection(readonly=True), sql, params, args.repeat)
+        print(f"{label:20s} fresh {fresh:.3f} ms  pooled {pooled:.3f} ms  pooled read-only {readonly:.3f} ms")
+    print(pool.stats())
+    pool.close()
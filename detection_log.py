@@ -0,0 +1,226 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+import cv2
+from database import ensure_detection_indexes, ensure_detection_columns
+
+_STOP = object()
+
+
+def configure_wal(conn):
+    # WAL lets readers such as /detection_logs run alongside the writer;
+    # synchronous=NORMAL only fsyncs at checkpoints instead of every commit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+
+class DetectionWriter:
+    """Writes detection_events rows from a single background thread.
+
+    Sightings (see sightings.py) get one row when they open, queued by
+    `open_sighting()`, which `update_sighting()` later rewrites in place.
+    Both only put the event on an in-memory queue. The writer thread takes
+    up to `batch_size` pending events, or whatever arrived within
+    `flush_interval` seconds, JPEG-encodes their frames and writes them with
+    one executemany for the new rows and one for the updates, in a single
+    transaction. `close()` (also run at interpreter exit) writes everything
+    still queued before returning.
+
+    With an `image_store` the JPEG goes to the store and the row only keeps
+    its content key in frame_key; otherwise it is stored in detected_frame.
+    """
+
+    def __init__(self, db_path, image_store=None, batch_size=64, flush_interval=0.25):
+        self.db_path = db_path
+        self.image_store = image_store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.events = queue.Queue()
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="detection-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def open_sighting(self, sighting, frame):
+        """Queue the row for a new sighting; its id is stored on `sighting.row_id`.
+
+        `frame` is a BGR image or already-encoded JPEG bytes.
+        """
+        self.start()
+        self.events.put(('open', sighting, sighting.values(), frame))
+
+    def update_sighting(self, sighting, frame=None):
+        """Queue the latest summary of an open or closed sighting, with a better frame if any"""
+        self.start()
+        self.events.put(('update', sighting, sighting.values(), frame))
+
+    def _next_batch(self):
+        first = self.events.get()
+        if first is _STOP:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                event = self.events.get(timeout=remaining) if remaining > 0 else self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event is _STOP:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        configure_wal(conn)
+        try:
+            with conn:
+                ensure_detection_columns(conn.cursor())
+                ensure_detection_indexes(conn.cursor())
+        except sqlite3.OperationalError as e:
+            print(f"Could not prepare detection_events: {e}")
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._write(conn, batch)
+        conn.close()
+
+    def _store_frame(self, frame):
+        # (detected_frame, frame_key) column values for a frame
+        if frame is None:
+            return None, None
+        if not isinstance(frame, bytes):
+            _, buffer = cv2.imencode('.jpg', frame)
+            frame = buffer.tobytes()
+        if self.image_store is not None:
+            return b'', self.image_store.put(frame)
+        return frame, None
+
+    def _write(self, conn, batch):
+        opened, opens, pending_updates = [], [], []
+        try:
+            with conn:
+                for kind, sighting, values, frame in batch:
+                    if kind == 'open':
+                        opened.append(sighting)
+                        opens.append(values + self._store_frame(frame))
+                    else:
+                        pending_updates.append((sighting, values[5:] + self._store_frame(frame)))
+                if opens:
+                    conn.executemany('''
+                        INSERT INTO detection_events (person_id, person_name, category, last_location, time,
+                                                      last_seen, frame_count, best_distance, detected_frame, frame_key)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', opens)
+                    # The transaction holds the write lock, so the new rows
+                    # got consecutive ids ending at the last inserted one
+                    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    for offset, sighting in enumerate(opened):
+                        sighting.row_id = last_id - len(opened) + 1 + offset
+                # Resolved after the opens, which may be in this same batch
+                updates = [values + (sighting.row_id,) for sighting, values in pending_updates
+                           if sighting.row_id is not None]
+                conn.executemany('''
+                    UPDATE detection_events
+                    SET last_seen = ?, frame_count = ?, best_distance = ?,
+                        detected_frame = COALESCE(?, detected_frame), frame_key = COALESCE(?, frame_key)
+                    WHERE id = ?
+                ''', updates)
+            self.written += len(batch)
+            self.batches += 1
+        except (sqlite3.Error, OSError) as e:
+            self.failed += len(batch)
+            print(f"Error writing {len(batch)} detection events: {e}")
+
+    def close(self):
+        """Flush every queued event and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self.events.put(_STOP)
+        thread.join()
+
+    def stats(self):
+        return {'queued': self.events.qsize(), 'written': self.written,
+                'batches': self.batches, 'failed': self.failed}
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(time_value, row_id):
+    return f"{time_value}|{row_id}"
+
+
+def decode_cursor(cursor):
+    """(time, id) from a page cursor; raises ValueError for a malformed one"""
+    time_value, sep, row_id = cursor.rpartition('|')
+    if not sep:
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return time_value, int(row_id)
+
+
+def page_args(args):
+    """fetch_detections keyword arguments from a request's query string"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    return {
+        'person': args.get('person') or None,
+        'category': args.get('category') or None,
+        'location': args.get('location') or None,
+        'cursor': args.get('cursor') or None,
+        'limit': limit,
+    }
+
+
+def fetch_detections(conn, person=None, category=None, location=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of detection events, newest first, without their images.
+
+    Keyset pagination on (time, id): `cursor` is the `next_cursor` of the
+    previous page, so every page is a short range scan of one of the
+    detection indexes no matter how many events the table holds. Returns
+    (events, next_cursor); next_cursor is None on the last page.
+    """
+    clauses, params = [], []
+    for column, value in (('person_name', person), ('category', category), ('last_location', location)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if cursor:
+        clauses.append("(time, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    rows = conn.execute(f'''
+        SELECT id, person_name, category, last_location, time, frame_key, last_seen, frame_count
+        FROM detection_events
+        {where}
+        ORDER BY time DESC, id DESC
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+
+    events = [{'id': row[0], 'person_name': row[1], 'category': row[2], 'location': row[3],
+               'time': row[4], 'frame_key': row[5], 'last_seen': row[6] or row[4],
+               'frame_count': row[7]} for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(events[-1]['time'], events[-1]['id'])
+    return events, next_cursor
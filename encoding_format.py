@@ -0,0 +1,65 @@
+import pickle
+import struct
+import numpy as np
+
+# Packed encoding layout (little-endian):
+#   4 bytes  magic b'FENC'
+#   1 byte   format version
+#   1 byte   dtype code (see DTYPE_CODES)
+#   2 bytes  number of dimensions
+#   N bytes  raw float values
+MAGIC = b'FENC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBH')
+DTYPE_CODES = {1: np.dtype('<f4'), 2: np.dtype('<f8')}
+CODE_FOR_DTYPE = {dtype: code for code, dtype in DTYPE_CODES.items()}
+DEFAULT_DTYPE = np.dtype('<f4')
+
+
+def is_packed(blob):
+    return blob[:4] == MAGIC
+
+
+def pack_encoding(encoding, dtype=DEFAULT_DTYPE):
+    """Serialize a face encoding into the compact header + raw float layout"""
+    dtype = np.dtype(dtype).newbyteorder('<')
+    values = np.ascontiguousarray(encoding, dtype=dtype).ravel()
+    return HEADER.pack(MAGIC, FORMAT_VERSION, CODE_FOR_DTYPE[dtype], len(values)) + values.tobytes()
+
+
+def _read_header(blob):
+    magic, version, code, dim = HEADER.unpack_from(blob)
+    if version != FORMAT_VERSION or code not in DTYPE_CODES:
+        raise ValueError(f"Unsupported encoding format version {version} / dtype code {code}")
+    return DTYPE_CODES[code], dim
+
+
+def unpack_encoding(blob):
+    """Decode one stored encoding.
+
+    Packed blobs come back as a read-only zero-copy view over the bytes;
+    legacy pickle blobs are still accepted so an unmigrated database keeps
+    working.
+    """
+    if not is_packed(blob):
+        return pickle.loads(blob)
+    dtype, dim = _read_header(blob)
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER.size)
+
+
+def unpack_many(blobs, dim=128):
+    """Decode a list of stored encodings into one (N, dim) float64 matrix.
+
+    When every blob shares the same packed header the payloads are joined and
+    decoded with a single frombuffer call.
+    """
+    if not blobs:
+        return np.empty((0, dim), dtype=np.float64)
+    first = blobs[0]
+    if is_packed(first):
+        header = bytes(first[:HEADER.size])
+        if all(bytes(blob[:HEADER.size]) == header for blob in blobs):
+            dtype, dim = _read_header(first)
+            payload = b''.join(bytes(blob[HEADER.size:]) for blob in blobs)
+            return np.frombuffer(payload, dtype=dtype).reshape(len(blobs), dim).astype(np.float64)
+    return np.vstack([np.asarray(unpack_encoding(blob), dtype=np.float64).ravel() for blob in blobs])
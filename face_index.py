@@ -0,0 +1,271 @@
+import os
+import time
+import numpy as np
+from matcher import face_distances
+
+# Rows scored per chunk when assigning vectors to clusters, bounds memory use
+ASSIGN_CHUNK = 8192
+
+
+def _top_k(distances, k):
+    """Indices of the k smallest values of each row, sorted ascending"""
+    k = min(k, distances.shape[1])
+    if k == 0:
+        return np.empty((len(distances), 0), dtype=np.int64)
+    if k < distances.shape[1]:
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        nearest = np.tile(np.arange(distances.shape[1]), (len(distances), 1))
+    order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def _pad(distances, rows, k):
+    """Pad per-probe results to k columns with (inf, -1) so callers get fixed shapes"""
+    missing = k - distances.shape[1]
+    if missing > 0:
+        distances = np.hstack([distances, np.full((len(distances), missing), np.inf)])
+        rows = np.hstack([rows, np.full((len(rows), missing), -1, dtype=np.int64)])
+    return distances, rows
+
+
+class BruteForceIndex:
+    """Exact search: score every gallery row"""
+
+    name = 'exact'
+
+    def __init__(self):
+        self.vectors = np.empty((0, 128))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def build(self, vectors):
+        self.vectors = vectors
+
+    def add(self, vectors, start):
+        self.vectors = vectors
+
+    def search(self, probes, k):
+        """Return (distances, rows), both (P, k), nearest first; missing slots are (inf, -1)"""
+        distances = face_distances(probes, self.vectors)
+        nearest = _top_k(distances, k)
+        return _pad(np.take_along_axis(distances, nearest, axis=1), nearest, k)
+
+    def save(self, path, version):
+        pass
+
+    def load(self, path, vectors, version):
+        self.build(vectors)
+        return True
+
+
+class IVFIndex:
+    """Approximate search with an inverted file over k-means coarse clusters.
+
+    Every gallery row is filed under its nearest centroid; a query only scores
+    the rows in its `n_probe` nearest clusters. More lists make each list
+    shorter (faster), more probes visit more lists (higher recall).
+    """
+
+    name = 'ivf'
+
+    def __init__(self, n_lists=1024, n_probe=16, train_iterations=10, train_sample=100000, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_iterations = train_iterations
+        self.train_sample = train_sample
+        self.seed = seed
+        self.vectors = np.empty((0, 128))
+        self.centroids = np.empty((0, 128))
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.lists = []
+        self.trained_rows = 0
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _assign(self, vectors):
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_CHUNK):
+            chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK])
+            assignments[start:start + len(chunk)] = face_distances(chunk, self.centroids).argmin(axis=1)
+        return assignments
+
+    def train(self, vectors):
+        """Fit the coarse centroids with plain k-means on a sample of the gallery"""
+        rng = np.random.default_rng(self.seed)
+        n_lists = max(1, min(self.n_lists, len(vectors)))
+        sample_size = min(len(vectors), self.train_sample)
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float64)
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        self.trained_rows = len(vectors)
+        for _ in range(self.train_iterations):
+            labels = self._assign(sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            filled = counts > 0
+            self.centroids[filled] = sums[filled] / counts[filled, None]
+            # Re-seed empty clusters from random sample points
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                self.centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+
+    def _rebuild_lists(self):
+        order = np.argsort(self.assignments, kind='stable')
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def build(self, vectors):
+        self.vectors = vectors
+        if len(vectors) == 0:
+            self.centroids = np.empty((0, vectors.shape[1] if vectors.ndim == 2 else 128))
+            self.assignments = np.empty(0, dtype=np.int32)
+            self.lists = []
+            return
+        self.train(vectors)
+        self.assignments = self._assign(vectors)
+        self._rebuild_lists()
+
+    def add(self, vectors, start):
+        """File rows vectors[start:] into their nearest lists without retraining"""
+        self.vectors = vectors
+        # Small galleries get fewer clusters than requested; retrain once the
+        # gallery has doubled so they catch up as enrollment grows
+        if len(self.centroids) == 0 or (len(self.centroids) < self.n_lists and len(vectors) >= 2 * self.trained_rows):
+            self.build(vectors)
+            return
+        new_assignments = self._assign(vectors[start:])
+        self.assignments = np.concatenate([self.assignments[:start], new_assignments])
+        for list_id in np.unique(new_assignments):
+            new_rows = start + np.flatnonzero(new_assignments == list_id)
+            self.lists[list_id] = np.concatenate([self.lists[list_id], new_rows])
+
+    def search(self, probes, k):
+        """Return (distances, rows), both (P, k), nearest first; missing slots are (inf, -1)"""
+        probes = np.asarray(probes, dtype=np.float64).reshape(len(probes), -1)
+        if len(self.centroids) == 0:
+            return _pad(np.empty((len(probes), 0)), np.empty((len(probes), 0), dtype=np.int64), k)
+        n_probe = min(self.n_probe, len(self.centroids))
+        nearest_lists = _top_k(face_distances(probes, self.centroids), n_probe)
+
+        all_distances = np.full((len(probes), k), np.inf)
+        all_rows = np.full((len(probes), k), -1, dtype=np.int64)
+        for i, probe in enumerate(probes):
+            candidates = np.concatenate([self.lists[j] for j in nearest_lists[i]])
+            if len(candidates) == 0:
+                continue
+            distances = face_distances(probe[None, :], self.vectors[candidates])
+            nearest = _top_k(distances, k)[0]
+            all_distances[i, :len(nearest)] = distances[0, nearest]
+            all_rows[i, :len(nearest)] = candidates[nearest]
+        return all_distances, all_rows
+
+    def save(self, path, version):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments,
+                 version=np.int64(version), n_rows=np.int64(len(self.vectors)))
+        os.replace(tmp_path, path)
+
+    def load(self, path, vectors, version):
+        """Restore a saved index for `vectors`.
+
+        A stale file (different gallery version) keeps its trained centroids
+        and only re-files the rows, which is far cheaper than retraining.
+        """
+        try:
+            saved = np.load(path)
+            centroids = saved['centroids']
+            assignments = saved['assignments']
+            saved_version = int(saved['version'])
+            saved_rows = int(saved['n_rows'])
+        except (OSError, KeyError, ValueError):
+            return False
+        if len(centroids) == 0:
+            return False
+        self.vectors = vectors
+        self.centroids = centroids
+        self.trained_rows = len(assignments)
+        if saved_version == version and saved_rows == len(vectors):
+            self.assignments = assignments
+        else:
+            self.assignments = self._assign(vectors)
+        self._rebuild_lists()
+        return True
+
+
+INDEX_BACKENDS = {
+    BruteForceIndex.name: BruteForceIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def index_factory(name, **options):
+    """Return a callable creating the named index backend, or None for plain exact matching"""
+    if name is None:
+        return None
+    backend = INDEX_BACKENDS[name]
+    return lambda: backend(**options)
+
+
+def index_path(db_path, index):
+    """Indexes are persisted next to the database, e.g. record.db.ivf.npz"""
+    return f"{db_path}.{index.name}.npz"
+
+
+def measure_recall(index, vectors, k=10, n_queries=200, noise=0.02, seed=0):
+    """Recall@k and mean per-query latency of `index` against exact search.
+
+    Queries are gallery rows with a little noise added, standing in for new
+    captures of enrolled people.
+    """
+    rng = np.random.default_rng(seed)
+    n_queries = min(n_queries, len(vectors))
+    queries = np.asarray(vectors[rng.choice(len(vectors), n_queries, replace=False)], dtype=np.float64)
+    queries = queries + rng.normal(scale=noise, size=queries.shape)
+
+    exact = BruteForceIndex()
+    exact.build(vectors)
+    started = time.perf_counter()
+    _, exact_rows = exact.search(queries, k)
+    exact_latency = (time.perf_counter() - started) / n_queries
+
+    started = time.perf_counter()
+    _, approx_rows = index.search(queries, k)
+    approx_latency = (time.perf_counter() - started) / n_queries
+
+    hits = sum(len(np.intersect1d(exact_rows[i], approx_rows[i])) for i in range(n_queries))
+    return {
+        'recall': hits / float(n_queries * min(k, len(vectors))),
+        'latency_ms': approx_latency * 1000,
+        'exact_latency_ms': exact_latency * 1000,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from gallery import FaceGallery
+
+    parser = argparse.ArgumentParser(description="Build the IVF face index for record.db and report recall against exact search")
+    parser.add_argument('--db', default='record.db', help="Path to the SQLite database")
+    parser.add_argument('--lists', type=int, default=1024, help="Number of coarse clusters")
+    parser.add_argument('--probe', type=int, nargs='+', default=[1, 4, 8, 16, 32], help="n_probe values to evaluate")
+    parser.add_argument('--k', type=int, default=10, help="Neighbours compared for recall@k")
+    parser.add_argument('--queries', type=int, default=200, help="Number of test queries")
+    args = parser.parse_args()
+
+    gallery = FaceGallery(args.db)
+    gallery.reload()
+    index = IVFIndex(n_lists=args.lists)
+    started = time.perf_counter()
+    index.build(gallery.encodings)
+    print(f"Built IVF index over {len(index)} encodings in {time.perf_counter() - started:.1f}s")
+    index.save(index_path(args.db, index), gallery.version)
+
+    for n_probe in args.probe:
+        index.n_probe = n_probe
+        stats = measure_recall(index, gallery.encodings, args.k, args.queries)
+        print(f"n_probe={n_probe:4d}  recall@{args.k}={stats['recall']:.3f}  "
+              f"{stats['latency_ms']:.2f} ms/query (exact {stats['exact_latency_ms']:.2f} ms/query)")
@@ -0,0 +1,199 @@
+import numpy as np
+from matcher import DEFAULT_TOLERANCE, DEFAULT_TOP_K, face_distances, rank_people
+
+# Most encodings kept per person for re-ranking
+MAX_EXEMPLARS = 4
+# A further exemplar must be at least this far from the ones already kept;
+# closer encodings are near-duplicates of the same shot
+MIN_EXEMPLAR_SPREAD = 0.15
+# Encodings this far from the person's medoid are treated as someone else,
+# e.g. a bystander in the enrollment photo (same scale as the match tolerance)
+OUTLIER_DISTANCE = 0.6
+# People shortlisted by centroid distance before exemplar re-ranking
+SHORTLIST = 32
+
+
+def build_template(encodings, max_exemplars=MAX_EXEMPLARS, min_spread=MIN_EXEMPLAR_SPREAD,
+                   outlier_distance=OUTLIER_DISTANCE):
+    """Aggregate one person's encodings into (centroid, exemplars, rejected count).
+
+    The medoid (the encoding with the smallest total distance to the others)
+    anchors the person; with three or more encodings, those farther than
+    `outlier_distance` from it are rejected. The centroid is the mean of the
+    rest. Exemplars are picked farthest-first starting from the encoding
+    nearest the centroid, so they cover the person's variation (pose,
+    lighting, age) without near-duplicates.
+    """
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+    rejected = 0
+    if len(encodings) >= 3:
+        pairwise = face_distances(encodings, encodings)
+        medoid = int(np.argmin(pairwise.sum(axis=1)))
+        keep = pairwise[medoid] <= outlier_distance
+        rejected = int(len(encodings) - keep.sum())
+        encodings = encodings[keep]
+    centroid = encodings.mean(axis=0)
+
+    chosen = [int(np.argmin(face_distances(centroid[None, :], encodings)[0]))]
+    nearest_chosen = face_distances(encodings[chosen], encodings)[0]
+    while len(chosen) < max_exemplars:
+        candidate = int(np.argmax(nearest_chosen))
+        if nearest_chosen[candidate] < min_spread:
+            break
+        chosen.append(candidate)
+        nearest_chosen = np.minimum(nearest_chosen, face_distances(encodings[candidate][None, :], encodings)[0])
+    return centroid, encodings[chosen], rejected
+
+
+class PersonTemplates:
+    """Template-first gallery search: one centroid and a few exemplars per person.
+
+    `match()` scores every probe against the person centroids, shortlists
+    the nearest `shortlist` people, and re-ranks them by their closest
+    exemplar. Final distances are exemplar distances, so they stay on the
+    same scale as the tolerance used for a full scan of every encoding.
+
+    Exemplars are stored grouped by person; `starts` and `counts` give each
+    person's slice, in the same order as `person_ids` and `centroids`. The
+    arrays are swapped together as one tuple, so a concurrent `match()`
+    never sees a half-updated set.
+    """
+
+    def __init__(self, max_exemplars=MAX_EXEMPLARS, min_spread=MIN_EXEMPLAR_SPREAD,
+                 outlier_distance=OUTLIER_DISTANCE, shortlist=SHORTLIST):
+        self.max_exemplars = max_exemplars
+        self.min_spread = min_spread
+        self.outlier_distance = outlier_distance
+        self.shortlist = shortlist
+        self._set([], [], [], [])
+        self.source_rows = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.arrays[4])
+
+    def _build_people(self, groups):
+        centroids, exemplars, counts, rejected = [], [], [], 0
+        for encodings in groups:
+            centroid, kept, dropped = build_template(encodings, self.max_exemplars, self.min_spread,
+                                                     self.outlier_distance)
+            centroids.append(centroid)
+            exemplars.append(kept)
+            counts.append(len(kept))
+            rejected += dropped
+        return centroids, exemplars, counts, rejected
+
+    def build(self, encodings, person_ids):
+        """Build every person's template from the gallery rows"""
+        person_ids = np.asarray(person_ids, dtype=np.int64)
+        self.source_rows = len(person_ids)
+        if not len(person_ids):
+            self._set([], [], [], [])
+            self.rejected = 0
+            return
+        order = np.argsort(person_ids, kind='stable')
+        sorted_ids = person_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+        groups = [encodings[order[start:end]] for start, end in zip(starts, np.r_[starts[1:], len(order)])]
+        centroids, exemplars, counts, rejected = self._build_people(groups)
+        self._set(sorted_ids[starts], centroids, exemplars, counts)
+        self.rejected = rejected
+
+    def add_person(self, person_id, encodings):
+        """Add (or extend) one person's template after an enrollment"""
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+        if not len(encodings):
+            return
+        person_ids, centroids, starts, counts, exemplars = self.arrays
+        existing = np.flatnonzero(person_ids == person_id)
+        exemplars = [exemplars[start:start + count] for start, count in zip(starts, counts)]
+        person_ids, centroids, counts = list(person_ids), list(centroids), list(counts)
+        if len(existing):
+            # Earlier rows are only represented by their exemplars now
+            i = int(existing[0])
+            encodings = np.vstack([exemplars[i], encodings])
+            for values in (person_ids, counts, centroids, exemplars):
+                del values[i]
+        new_centroids, new_exemplars, new_counts, rejected = self._build_people([encodings])
+        self._set(np.array(person_ids + [person_id], dtype=np.int64), centroids + new_centroids,
+                  exemplars + new_exemplars, counts + new_counts)
+        self.source_rows += len(encodings)
+        self.rejected += rejected
+
+    def _set(self, person_ids, centroids, exemplars, counts):
+        counts = np.asarray(counts, dtype=np.int64)
+        starts = np.r_[0, np.cumsum(counts)[:-1]].astype(np.int64) if len(counts) else counts
+        self.arrays = (np.asarray(person_ids, dtype=np.int64),
+                       np.vstack(centroids) if len(centroids) else np.empty((0, 128)),
+                       starts, counts,
+                       np.vstack(exemplars) if len(exemplars) else np.empty((0, 128)))
+
+    def match(self, probes, top_k=DEFAULT_TOP_K, tolerance=DEFAULT_TOLERANCE):
+        """Result dicts like matcher.match_faces, from centroid shortlisting and exemplar re-ranking"""
+        if len(probes) == 0:
+            return []
+        person_ids, centroids, starts, counts, exemplars = self.arrays
+        probes = np.asarray(probes, dtype=np.float64).reshape(len(probes), -1)
+        if len(person_ids) == 0:
+            return rank_people(person_ids, np.empty((len(probes), 0)), top_k, tolerance)
+        shortlist = min(max(self.shortlist, top_k), len(person_ids))
+        centroid_distances = face_distances(probes, centroids)
+        if shortlist < len(person_ids):
+            candidates = np.argpartition(centroid_distances, shortlist - 1, axis=1)[:, :shortlist]
+        else:
+            candidates = np.tile(np.arange(len(person_ids)), (len(probes), 1))
+
+        results = []
+        for probe, people in zip(probes, candidates):
+            rows = np.concatenate([np.arange(starts[j], starts[j] + counts[j]) for j in people])
+            distances = face_distances(probe[None, :], exemplars[rows])[0]
+            # Closest exemplar per shortlisted person
+            per_person = np.minimum.reduceat(distances, np.r_[0, np.cumsum(counts[people])[:-1]])
+            results.extend(rank_people(person_ids[people], per_person[None, :], top_k, tolerance))
+        return results
+
+    def stats(self):
+        return {
+            'people': len(self.arrays[0]),
+            'source_rows': self.source_rows,
+            'exemplar_rows': len(self),
+            'rejected_outliers': self.rejected,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from gallery import DB_PATH, FaceGallery
+    from matcher import match_faces
+
+    parser = argparse.ArgumentParser(description="Compare template-first search with a full scan of every encoding")
+    parser.add_argument('--db', default=DB_PATH, help="Path to the SQLite database")
+    parser.add_argument('--queries', type=int, default=500, help="Number of test probes")
+    parser.add_argument('--noise', type=float, default=0.03, help="Noise added to the probes drawn from the gallery")
+    args = parser.parse_args()
+
+    gallery = FaceGallery(args.db)
+    gallery.reload()
+    if len(gallery) == 0:
+        raise SystemExit("The gallery is empty")
+    templates = PersonTemplates()
+    started = time.perf_counter()
+    templates.build(gallery.encodings, gallery.person_ids)
+    print(f"Built templates in {time.perf_counter() - started:.1f}s: {templates.stats()}")
+
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, len(gallery), args.queries)
+    probes = gallery.encodings[rows] + rng.normal(0, args.noise, (args.queries, gallery.encodings.shape[1]))
+    started = time.perf_counter()
+    full = match_faces(probes, gallery.encodings, gallery.person_ids)
+    full_ms = (time.perf_counter() - started) * 1000 / args.queries
+    started = time.perf_counter()
+    templated = templates.match(probes)
+    template_ms = (time.perf_counter() - started) * 1000 / args.queries
+
+    agree = sum(a['person_id'] == b['person_id'] for a, b in zip(full, templated))
+    recall = np.mean([b['person_id'] == gallery.person_ids[row] for b, row in zip(templated, rows)])
+    print(f"gallery rows {len(gallery)} -> {len(templates)} ({len(gallery) / max(1, len(templates)):.1f}x fewer)")
+    print(f"full scan {full_ms:.3f} ms/probe, templates {template_ms:.3f} ms/probe, "
+          f"{agree}/{args.queries} best matches agree, recall@1 {recall:.3f}")
@@ -0,0 +1,115 @@
+import threading
+from collections import deque
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+KEEP_EVERY_NTH = 'keep_every_nth'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, KEEP_EVERY_NTH)
+
+
+class FrameSlot:
+    """Bounded queue of pending frames for one camera.
+
+    drop_oldest   newer frames supersede unprocessed older ones (latest wins)
+    drop_newest   frames arriving while the slot is full are rejected
+    keep_every_nth  only every nth uploaded frame is admitted, then latest wins
+    """
+
+    def __init__(self, depth=1, policy=DROP_OLDEST, every_nth=1):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown frame drop policy: {policy}")
+        self.depth = max(1, depth)
+        self.policy = policy
+        self.every_nth = max(1, every_nth)
+        self.frames = deque()
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+
+    def put(self, item):
+        """Admit a frame according to the policy; returns False when it was dropped"""
+        self.received += 1
+        if self.policy == KEEP_EVERY_NTH and (self.received - 1) % self.every_nth:
+            self.dropped += 1
+            return False
+        if len(self.frames) >= self.depth:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            self.frames.popleft()
+            self.dropped += 1
+        self.frames.append(item)
+        return True
+
+    def stats(self):
+        return {
+            'queued': len(self.frames),
+            'received': self.received,
+            'dropped': self.dropped,
+            'processed': self.processed,
+        }
+
+
+class FrameQueues:
+    """Per-camera frame slots served round-robin to one consumer.
+
+    `put()` never blocks the uploader; `get()` blocks until some camera has a
+    pending frame and hands frames out fairly across cameras.
+    """
+
+    def __init__(self, depth=1, policy=DROP_OLDEST, every_nth=1, camera_policies=None):
+        self.depth = depth
+        self.policy = policy
+        self.every_nth = every_nth
+        # camera_id -> {'depth': ..., 'policy': ..., 'every_nth': ...} overrides
+        self.camera_policies = camera_policies or {}
+        self.slots = {}
+        self.ready = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+
+    def _slot(self, camera_id):
+        slot = self.slots.get(camera_id)
+        if slot is None:
+            options = {'depth': self.depth, 'policy': self.policy, 'every_nth': self.every_nth}
+            options.update(self.camera_policies.get(camera_id, {}))
+            slot = self.slots[camera_id] = FrameSlot(**options)
+        return slot
+
+    def put(self, camera_id, item):
+        """Offer a frame; returns (accepted, stats) for the camera"""
+        with self.cond:
+            slot = self._slot(camera_id)
+            was_empty = not slot.frames
+            accepted = slot.put(item)
+            if accepted and was_empty:
+                self.ready.append(camera_id)
+                self.cond.notify()
+            return accepted, slot.stats()
+
+    def get(self, timeout=None):
+        """Next (camera_id, item), or None when closed or on timeout"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.ready or self.closed, timeout):
+                return None
+            if not self.ready:
+                return None
+            camera_id = self.ready.popleft()
+            slot = self.slots[camera_id]
+            item = slot.frames.popleft()
+            slot.processed += 1
+            if slot.frames:
+                self.ready.append(camera_id)
+            return camera_id, item
+
+    def stats(self, camera_id=None):
+        with self.cond:
+            if camera_id is not None:
+                slot = self.slots.get(camera_id)
+                return slot.stats() if slot else None
+            return {camera: slot.stats() for camera, slot in self.slots.items()}
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
@@ -0,0 +1,270 @@
+import sqlite3
+import threading
+import time
+import numpy as np
+from database import ensure_gallery_version, get_gallery_version
+from encoding_format import unpack_many
+from face_index import index_path
+from face_templates import PersonTemplates
+from gallery_snapshot import export_snapshot, load_snapshot, read_snapshot_version
+from matcher import DEFAULT_TOLERANCE, DEFAULT_TOP_K, match_faces
+
+DB_PATH = 'record.db'
+ENCODING_DIM = 128
+# Seconds between checks of the database gallery version
+VERSION_CHECK_INTERVAL = 5.0
+
+
+class FaceGallery:
+    """Process-wide in-memory copy of every enrolled face encoding.
+
+    Encodings live in one stacked (N, 128) matrix with a parallel array of
+    person ids, so matching a frame never has to touch SQLite. Enrollment
+    appends in place; `reload()` rebuilds everything from the database.
+
+    With a `snapshot_dir`, `load()` memory-maps a read-only on-disk snapshot
+    instead, so every worker process shares the same physical pages. The
+    snapshot carries the database gallery version and is rebuilt when stale.
+
+    With an `index_factory` (see face_index.index_factory) matching goes
+    through a search index persisted next to the database instead of an
+    exact scan of every row.
+
+    With a `shard` of (index, count) only the people whose id falls in that
+    shard are loaded (see sharded_gallery.py).
+
+    With `templates` matching searches per-person templates instead of every
+    row: a centroid and a few diverse exemplars per person, with outlier
+    encodings left out (see face_templates.py). This takes the place of the
+    index.
+    """
+
+    def __init__(self, db_path=DB_PATH, snapshot_dir=None, index_factory=None, shard=None, templates=False):
+        self.db_path = db_path
+        self.shard = shard
+        self.use_templates = templates
+        self.templates = None
+        self.snapshot_dir = snapshot_dir
+        self.index_factory = index_factory
+        self.index = None
+        self.lock = threading.RLock()
+        self._matrix = np.empty((0, ENCODING_DIM), dtype=np.float64)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self.face_dict = {}
+        self.version = None
+        self._last_version_check = 0.0
+        self._refresher = None
+        # Serializes reloads from refresh_if_stale() with enrollments
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def encodings(self):
+        return self._matrix[:self._size]
+
+    @property
+    def person_ids(self):
+        return self._ids[:self._size]
+
+    def reload(self):
+        """Load every encoding and person from the database, replacing the current contents"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            ensure_gallery_version(cursor)
+            conn.commit()
+            version = get_gallery_version(cursor)
+            if self.shard is None:
+                cursor.execute("SELECT person_id, encoding FROM face_encodings ORDER BY id")
+                rows = cursor.fetchall()
+                cursor.execute("SELECT id, name, category FROM known_faces")
+                face_rows = cursor.fetchall()
+            else:
+                shard, count = self.shard
+                cursor.execute("SELECT person_id, encoding FROM face_encodings WHERE person_id % ? = ? ORDER BY id",
+                               (count, shard))
+                rows = cursor.fetchall()
+                cursor.execute("SELECT id, name, category FROM known_faces WHERE id % ? = ?", (count, shard))
+                face_rows = cursor.fetchall()
+            conn.close()
+        except sqlite3.OperationalError as e:
+            print(f"Error loading face gallery: {e}")
+            return False
+
+        matrix = unpack_many([row[1] for row in rows], ENCODING_DIM)
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        face_dict = {row[0]: {'name': row[1], 'category': row[2]} for row in face_rows}
+        index = self._build_index(matrix, version)
+        templates = self._build_templates(matrix, ids)
+
+        with self.lock:
+            self._matrix = matrix
+            self._ids = ids
+            self._size = len(rows)
+            self.face_dict = face_dict
+            self.version = version
+            self.index = index
+            self.templates = templates
+        print(f"Face gallery loaded: {len(rows)} encodings for {len(face_dict)} people")
+        return True
+
+    def load(self):
+        """Startup entry point: map the snapshot if it is current, otherwise rebuild from the database"""
+        if self.snapshot_dir is None:
+            return self.reload()
+        db_version = self._db_version()
+        if db_version is None:
+            return self.reload()
+        if read_snapshot_version(self.snapshot_dir) == db_version and self._load_snapshot():
+            return True
+        if not self.reload():
+            return False
+        encodings, person_ids, face_dict = self.snapshot()
+        try:
+            export_snapshot(encodings, person_ids, face_dict, self.version, self.snapshot_dir)
+        except OSError as e:
+            print(f"Error writing gallery snapshot: {e}")
+        return True
+
+    def refresh_if_stale(self, interval=VERSION_CHECK_INTERVAL):
+        """Reload when the database version moved on, checking at most once per interval"""
+        now = time.monotonic()
+        if now - self._last_version_check < interval:
+            return False
+        self._last_version_check = now
+        with self._refresh_lock:
+            db_version = self._db_version()
+            if db_version is None or db_version == self.version:
+                return False
+            return self.load()
+
+    def start_refresher(self, interval=VERSION_CHECK_INTERVAL):
+        """Check for database changes from a background thread, off the recognition path"""
+        if self._refresher is not None:
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, args=(interval,),
+                                           name="gallery-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh_if_stale(0)
+            except Exception as e:
+                print(f"Error refreshing face gallery: {e}")
+
+    def _db_version(self):
+        # A plain read on a read-only connection, so the periodic check never
+        # waits on the write lock; reload() creates the table and triggers
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            version = get_gallery_version(conn.cursor())
+            conn.close()
+            return version
+        except sqlite3.OperationalError as e:
+            print(f"Error reading gallery version: {e}")
+            return None
+
+    def _load_snapshot(self):
+        loaded = load_snapshot(self.snapshot_dir)
+        if loaded is None:
+            return False
+        encodings, person_ids, _, meta = loaded
+        index = self._build_index(encodings, meta['version'])
+        templates = self._build_templates(encodings, person_ids)
+        with self.lock:
+            self._matrix = encodings
+            self._ids = person_ids
+            self._size = meta['count']
+            self.face_dict = meta['people']
+            self.version = meta['version']
+            self.index = index
+            self.templates = templates
+        print(f"Face gallery mapped from snapshot v{meta['version']}: {meta['count']} encodings")
+        return True
+
+    def _build_templates(self, vectors, person_ids):
+        if not self.use_templates:
+            return None
+        templates = PersonTemplates()
+        templates.build(vectors, person_ids)
+        print(f"Face templates built: {templates.stats()}")
+        return templates
+
+    def _build_index(self, vectors, version):
+        if self.index_factory is None or self.use_templates:
+            return None
+        index = self.index_factory()
+        path = index_path(self.db_path, index)
+        if not index.load(path, vectors, version):
+            index.build(vectors)
+        try:
+            index.save(path, version)
+        except OSError as e:
+            print(f"Error saving {index.name} index: {e}")
+        return index
+
+    def add_person(self, person_id, name, category, encodings):
+        """Register a newly enrolled person and append their encodings.
+
+        The enrollment is committed before this is called, so a refresh in
+        between may already have loaded the person; their rows are then not
+        appended a second time.
+        """
+        with self._refresh_lock:
+            self._add_person(person_id, name, category, encodings)
+            self._advance_version(len(encodings))
+
+    def _advance_version(self, bumps):
+        # The enrollment's own face_encodings inserts moved the database
+        # version on by one each; if nothing else changed, this gallery is
+        # already current and must not reload for them
+        db_version = self._db_version()
+        with self.lock:
+            if db_version is not None and self.version is not None and db_version == self.version + bumps:
+                self.version = db_version
+
+    def _add_person(self, person_id, name, category, encodings):
+        with self.lock:
+            self.face_dict[person_id] = {'name': name, 'category': category}
+            # Enrollment always creates a new person, so rows already present
+            # came from a reload that ran after the enrollment committed
+            if len(encodings) and not np.any(self.person_ids == person_id):
+                self._append(np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM), person_id)
+                if self.templates is not None:
+                    self.templates.add_person(person_id, encodings)
+
+    def _append(self, rows, person_id):
+        needed = self._size + len(rows)
+        if needed > len(self._matrix) or not self._matrix.flags.writeable:
+            # Grow geometrically into fresh buffers so readers holding the
+            # old views (or the read-only snapshot mapping) stay untouched
+            capacity = max(needed, 2 * len(self._matrix), 64)
+            matrix = np.empty((capacity, ENCODING_DIM), dtype=np.float64)
+            ids = np.empty(capacity, dtype=np.int64)
+            matrix[:self._size] = self._matrix[:self._size]
+            ids[:self._size] = self._ids[:self._size]
+            self._matrix, self._ids = matrix, ids
+        self._matrix[self._size:needed] = rows
+        self._ids[self._size:needed] = person_id
+        start, self._size = self._size, needed
+        if self.index is not None:
+            self.index.add(self.encodings, start)
+
+    def snapshot(self):
+        """Return (encodings, person_ids, face_dict) as a consistent view for matching"""
+        with self.lock:
+            return self.encodings, self.person_ids, self.face_dict
+
+    def match(self, probes, top_k=DEFAULT_TOP_K, tolerance=DEFAULT_TOLERANCE):
+        """Match probe encodings against the gallery, returning (results, face_dict)"""
+        with self.lock:
+            encodings, person_ids, face_dict, index = self.encodings, self.person_ids, self.face_dict, self.index
+            templates = self.templates
+        if templates is not None:
+            return templates.match(probes, top_k, tolerance), face_dict
+        return match_faces(probes, encodings, person_ids, top_k, tolerance, index=index), face_dict
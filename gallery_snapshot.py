@@ -0,0 +1,115 @@
+import json
+import os
+import numpy as np
+
+SNAPSHOT_DIR = 'gallery_snapshot'
+META_FILE = 'gallery.json'
+CATEGORIES = ['criminal', 'missing person', 'suspect', 'other']
+
+
+def _array_path(snapshot_dir, version, name):
+    return os.path.join(snapshot_dir, f"gallery-v{version}.{name}.npy")
+
+
+def _write_array(path, array):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+def category_codes(person_ids, face_dict, categories):
+    """Map every gallery row to a small integer category code"""
+    unique_ids, inverse = np.unique(np.asarray(person_ids, dtype=np.int64), return_inverse=True)
+    person_codes = np.empty(len(unique_ids), dtype=np.int16)
+    for i, person_id in enumerate(unique_ids):
+        category = face_dict.get(int(person_id), {}).get('category', 'other')
+        if category not in categories:
+            categories.append(category)
+        person_codes[i] = categories.index(category)
+    return person_codes[inverse.ravel()]
+
+
+def export_snapshot(encodings, person_ids, face_dict, version, snapshot_dir=SNAPSHOT_DIR):
+    """Write the gallery to flat .npy files that workers can memory-map.
+
+    Array files are named after the gallery version and the metadata file is
+    swapped in last, so a reader never sees a half-written snapshot.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    categories = list(CATEGORIES)
+    codes = category_codes(person_ids, face_dict, categories)
+
+    _write_array(_array_path(snapshot_dir, version, 'encodings'), np.asarray(encodings, dtype=np.float64))
+    _write_array(_array_path(snapshot_dir, version, 'person_ids'), np.asarray(person_ids, dtype=np.int64))
+    _write_array(_array_path(snapshot_dir, version, 'categories'), codes)
+
+    meta = {
+        'version': version,
+        'count': len(person_ids),
+        'categories': categories,
+        'people': {str(person_id): info for person_id, info in face_dict.items()},
+    }
+    meta_path = os.path.join(snapshot_dir, META_FILE)
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+    remove_old_snapshots(snapshot_dir, version)
+    print(f"Gallery snapshot v{version} written: {len(person_ids)} encodings")
+
+
+def remove_old_snapshots(snapshot_dir, keep_version):
+    # Processes that still map an old file keep their pages until they reload
+    keep_prefix = f"gallery-v{keep_version}."
+    for filename in os.listdir(snapshot_dir):
+        if filename.startswith('gallery-v') and filename.endswith('.npy') and not filename.startswith(keep_prefix):
+            try:
+                os.remove(os.path.join(snapshot_dir, filename))
+            except OSError as e:
+                print(f"Error removing old snapshot file {filename}: {e}")
+
+
+def read_snapshot_version(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, META_FILE)) as f:
+            return json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """Memory-map a gallery snapshot read-only.
+
+    Returns (encodings, person_ids, category_codes, meta) or None when there is
+    no usable snapshot. All processes mapping the same files share the same
+    physical pages.
+    """
+    try:
+        with open(os.path.join(snapshot_dir, META_FILE)) as f:
+            meta = json.load(f)
+        version = meta['version']
+        encodings = np.load(_array_path(snapshot_dir, version, 'encodings'), mmap_mode='r')
+        person_ids = np.load(_array_path(snapshot_dir, version, 'person_ids'), mmap_mode='r')
+        codes = np.load(_array_path(snapshot_dir, version, 'categories'), mmap_mode='r')
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error loading gallery snapshot: {e}")
+        return None
+
+    if len(encodings) != meta['count'] or len(person_ids) != meta['count']:
+        print("Gallery snapshot is inconsistent, ignoring it")
+        return None
+    meta['people'] = {int(person_id): info for person_id, info in meta['people'].items()}
+    return encodings, person_ids, codes, meta
+
+
+if __name__ == "__main__":
+    import argparse
+    from gallery import FaceGallery
+
+    parser = argparse.ArgumentParser(description="Export the face gallery from record.db to a memory-mappable snapshot")
+    parser.add_argument('--db', default='record.db', help="Path to the SQLite database")
+    parser.add_argument('--dir', default=SNAPSHOT_DIR, help="Snapshot directory")
+    args = parser.parse_args()
+    FaceGallery(args.db, args.dir).load()
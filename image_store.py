@@ -0,0 +1,49 @@
+import hashlib
+import os
+import re
+import threading
+
+IMAGE_STORE_DIR = 'detection_frames'
+_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_valid_key(key):
+    return bool(key) and _KEY_PATTERN.match(key) is not None
+
+
+class ImageStore:
+    """Detection frames on disk, keyed by the SHA-256 of their JPEG bytes.
+
+    A frame with key `abcd...` lives at `<root>/ab/cd/abcd....jpg`, so no
+    directory grows past 65536 entries. Identical frames share one file, and
+    writes go through a temporary file and os.replace so readers never see a
+    partial image.
+    """
+
+    def __init__(self, root=IMAGE_STORE_DIR):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key + '.jpg')
+
+    def exists(self, key):
+        return is_valid_key(key) and os.path.exists(self.path(key))
+
+    def put(self, data):
+        """Store JPEG bytes unless already present and return their key"""
+        key = hashlib.sha256(data).hexdigest()
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def get(self, key):
+        """JPEG bytes for a key, or None if it is unknown"""
+        if not self.exists(key):
+            return None
+        with open(self.path(key), 'rb') as f:
+            return f.read()
@@ -0,0 +1,108 @@
+import numpy as np
+
+# Same default threshold face_recognition.compare_faces uses
+DEFAULT_TOLERANCE = 0.6
+DEFAULT_TOP_K = 3
+# Nearest rows fetched from an index per requested person, leaving room for
+# several encodings of the same person among the candidates
+CANDIDATES_PER_PERSON = 8
+
+
+def face_distances(probes, encodings):
+    """Euclidean distance of every probe encoding to every gallery row.
+
+    Computed as |p|^2 + |g|^2 - 2 p.g so the whole (P, N) block is a single
+    matrix product instead of a Python loop over faces.
+    """
+    probes = np.asarray(probes, dtype=np.float64).reshape(len(probes), -1)
+    encodings = np.asarray(encodings, dtype=np.float64)
+    if len(probes) == 0 or len(encodings) == 0:
+        return np.empty((len(probes), len(encodings)))
+    squared = (np.einsum('ij,ij->i', probes, probes)[:, None]
+               + np.einsum('ij,ij->i', encodings, encodings)[None, :]
+               - 2.0 * probes @ encodings.T)
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+
+def collapse_by_person(distances, person_ids):
+    """Reduce (P, N) row distances to (P, U) best distance per unique person id"""
+    person_ids = np.asarray(person_ids)
+    order = np.argsort(person_ids, kind='stable')
+    sorted_ids = person_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    per_person = np.minimum.reduceat(distances[:, order], starts, axis=1)
+    return sorted_ids[starts], per_person
+
+
+def rank_people(unique_ids, per_person, top_k=DEFAULT_TOP_K, tolerance=DEFAULT_TOLERANCE):
+    """Turn a (P, U) person distance matrix into one result dict per probe"""
+    results = []
+    k = min(top_k, per_person.shape[1])
+    for row in per_person:
+        if k == 0:
+            results.append({'matched': False, 'person_id': None, 'distance': None,
+                            'margin': None, 'candidates': []})
+            continue
+        nearest = np.argpartition(row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+        nearest = nearest[np.argsort(row[nearest], kind='stable')]
+        candidates = [(int(unique_ids[j]), float(row[j])) for j in nearest if np.isfinite(row[j])]
+        if not candidates:
+            results.append({'matched': False, 'person_id': None, 'distance': None,
+                            'margin': None, 'candidates': []})
+            continue
+        best_id, best_distance = candidates[0]
+        # Margin to the runner-up person; a small margin means an ambiguous match
+        if len(candidates) > 1:
+            margin = candidates[1][1] - best_distance
+        elif len(row) > 1:
+            margin = float(np.partition(row, 1)[1]) - best_distance
+        else:
+            margin = float('inf')
+        results.append({
+            'matched': best_distance <= tolerance,
+            'person_id': best_id,
+            'distance': best_distance,
+            'margin': margin,
+            'candidates': candidates,
+        })
+    return results
+
+
+def collapse_candidates(distances, rows, person_ids):
+    """Reduce per-probe nearest-row lists from an index to a (P, U) person distance matrix"""
+    person_ids = np.asarray(person_ids)
+    # Rows appended to the index after `person_ids` was captured are ignored
+    valid = (rows >= 0) & (rows < len(person_ids))
+    found = np.unique(person_ids[rows[valid]]) if valid.any() else np.empty(0, dtype=np.int64)
+    per_person = np.full((len(rows), len(found)), np.inf)
+    for i in range(len(rows)):
+        probe_rows = rows[i][valid[i]]
+        columns = np.searchsorted(found, person_ids[probe_rows])
+        np.minimum.at(per_person[i], columns, distances[i][valid[i]])
+    return found, per_person
+
+
+def match_faces(probes, encodings, person_ids, top_k=DEFAULT_TOP_K, tolerance=DEFAULT_TOLERANCE,
+                index=None):
+    """Match every probe encoding against the gallery in one batched pass.
+
+    Returns a list with one dict per probe holding the best person, its
+    distance, the margin to the runner-up and the top-k (person_id, distance)
+    candidates. Multiple encodings of the same person count once, at their
+    closest distance.
+
+    With an `index` (see face_index.py) only its nearest rows are scored, so
+    people outside them never show up as candidates.
+    """
+    if len(probes) == 0:
+        return []
+    if index is not None:
+        distances, rows = index.search(probes, top_k * CANDIDATES_PER_PERSON)
+        unique_ids, per_person = collapse_candidates(distances, rows, person_ids)
+        return rank_people(unique_ids, per_person, top_k, tolerance)
+    distances = face_distances(probes, encodings)
+    if distances.shape[1] == 0:
+        return rank_people(np.empty(0, dtype=np.int64), distances, top_k, tolerance)
+    unique_ids, per_person = collapse_by_person(distances, person_ids)
+    return rank_people(unique_ids, per_person, top_k, tolerance)
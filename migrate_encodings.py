@@ -0,0 +1,66 @@
+import argparse
+import os
+import sqlite3
+import pickle
+import numpy as np
+from encoding_format import is_packed, pack_encoding
+
+DB_PATH = 'record.db'
+
+
+def migrate_encodings(db_path=DB_PATH, batch_size=1000, dtype='float32', vacuum=False):
+    """Rewrite pickled face_encodings blobs in place using the packed format.
+
+    Rows are converted in id order, one transaction per batch, and rows that
+    are already packed are skipped, so the migration can be interrupted and
+    re-run safely.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    size_before = os.path.getsize(db_path)
+    converted = skipped = 0
+    last_id = 0
+
+    while True:
+        cursor.execute('''
+            SELECT id, encoding FROM face_encodings
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for row_id, blob in rows:
+            if is_packed(blob):
+                skipped += 1
+                continue
+            encoding = np.asarray(pickle.loads(blob))
+            updates.append((pack_encoding(encoding, dtype), row_id))
+
+        cursor.executemany("UPDATE face_encodings SET encoding = ? WHERE id = ?", updates)
+        conn.commit()
+        converted += len(updates)
+        last_id = rows[-1][0]
+        print(f"Migrated up to id {last_id}: {converted} converted, {skipped} already packed")
+
+    if vacuum:
+        # Reclaim the space freed by the smaller blobs
+        conn.execute("VACUUM")
+    conn.close()
+
+    size_after = os.path.getsize(db_path)
+    print(f"Done: {converted} encodings converted, database {size_before} -> {size_after} bytes")
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert pickled face encodings in record.db to the packed binary format")
+    parser.add_argument('--db', default=DB_PATH, help="Path to the SQLite database")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Rows converted per transaction")
+    parser.add_argument('--dtype', choices=['float32', 'float64'], default='float32', help="Storage precision")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM the database afterwards to shrink the file")
+    args = parser.parse_args()
+    migrate_encodings(args.db, args.batch_size, args.dtype, args.vacuum)
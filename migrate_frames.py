@@ -0,0 +1,70 @@
+import argparse
+import os
+import sqlite3
+from database import ensure_detection_columns
+from image_store import IMAGE_STORE_DIR, ImageStore
+
+DB_PATH = 'record.db'
+
+
+def migrate_frames(db_path=DB_PATH, store_dir=IMAGE_STORE_DIR, batch_size=200, vacuum=False):
+    """Move detected_frame BLOBs into the image store, keeping only their key.
+
+    Rows are processed in id order, one transaction per batch. Each frame is
+    written to the store before its row is updated and rows that already
+    have a frame_key are skipped, so the migration can be interrupted and
+    re-run safely. Identical frames end up as a single file.
+    """
+    store = ImageStore(store_dir)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    ensure_detection_columns(cursor)
+    conn.commit()
+    size_before = os.path.getsize(db_path)
+    moved = 0
+    keys = set()
+    last_id = 0
+
+    while True:
+        # Only the ids here; the blobs are fetched below one batch at a time
+        cursor.execute('''
+            SELECT id FROM detection_events
+            WHERE id > ? AND frame_key IS NULL AND length(detected_frame) > 0
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, batch_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            break
+
+        updates = []
+        for row_id in ids:
+            cursor.execute("SELECT detected_frame FROM detection_events WHERE id = ?", (row_id,))
+            key = store.put(bytes(cursor.fetchone()[0]))
+            keys.add(key)
+            updates.append((key, row_id))
+
+        cursor.executemany("UPDATE detection_events SET frame_key = ?, detected_frame = x'' WHERE id = ?", updates)
+        conn.commit()
+        moved += len(updates)
+        last_id = ids[-1]
+        print(f"Migrated up to id {last_id}: {moved} frames moved")
+
+    if vacuum:
+        # Reclaim the space freed by the removed blobs
+        conn.execute("VACUUM")
+    conn.close()
+
+    size_after = os.path.getsize(db_path)
+    print(f"Done: {moved} frames moved as {len(keys)} distinct images, database {size_before} -> {size_after} bytes")
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move detection frame BLOBs from record.db into the on-disk image store")
+    parser.add_argument('--db', default=DB_PATH, help="Path to the SQLite database")
+    parser.add_argument('--store', default=IMAGE_STORE_DIR, help="Image store directory")
+    parser.add_argument('--batch-size', type=int, default=200, help="Rows moved per transaction")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM the database afterwards to shrink the file")
+    args = parser.parse_args()
+    migrate_frames(args.db, args.store, args.batch_size, args.vacuum)
@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap per-camera check for whether a frame is worth running face detection on.
+
+    Frames are shrunk to `width` pixels wide, converted to grayscale and
+    compared against a running-average background. When fewer than
+    `min_changed` of the pixels moved by more than `threshold` grey levels the
+    frame is skipped. Every `force_every` frames a full detection runs anyway
+    so a person standing perfectly still is still picked up.
+    """
+
+    def __init__(self, threshold=25, min_changed=0.002, force_every=30, width=160,
+                 learning_rate=0.05, region_padding=0.15, max_region_fraction=0.5):
+        self.threshold = threshold
+        self.min_changed = min_changed
+        self.force_every = force_every
+        self.width = width
+        self.learning_rate = learning_rate
+        self.region_padding = region_padding
+        self.max_region_fraction = max_region_fraction
+        self.background = None
+        self.frames_since_full = 0
+
+    def check(self, frame):
+        """Return (detect, regions, changed_fraction).
+
+        `regions` is a list of (top, right, bottom, left) boxes in full
+        resolution to restrict detection to, or None to scan the whole frame.
+        """
+        height, width = frame.shape[:2]
+        scale = self.width / float(width)
+        small = cv2.resize(frame, (self.width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.frames_since_full = 0
+            return True, None, 1.0
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        mask = (diff > self.threshold).astype(np.uint8)
+        changed = float(mask.mean())
+
+        self.frames_since_full += 1
+        if self.frames_since_full >= self.force_every:
+            self.frames_since_full = 0
+            return True, None, changed
+        if changed < self.min_changed:
+            return False, [], changed
+        return True, self._regions(mask, scale, height, width), changed
+
+    def _regions(self, mask, scale, height, width):
+        mask = cv2.dilate(mask, np.ones((5, 5), np.uint8), iterations=2)
+        contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        regions = []
+        covered = 0
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            # Pad generously: motion often covers only part of a head
+            pad_x, pad_y = int(w * self.region_padding) + 2, int(h * self.region_padding) + 2
+            left = max(0, int((x - pad_x) / scale))
+            top = max(0, int((y - pad_y) / scale))
+            right = min(width, int((x + w + pad_x) / scale))
+            bottom = min(height, int((y + h + pad_y) / scale))
+            regions.append((top, right, bottom, left))
+            covered += (right - left) * (bottom - top)
+        if covered > self.max_region_fraction * width * height:
+            return None
+        return regions
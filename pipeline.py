@@ -0,0 +1,289 @@
+import threading
+import time
+import zlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from frame_queue import DROP_OLDEST, FrameQueues
+import recognition
+from recognition import analyze_batch, recognize_faces
+
+
+class RecognitionPipeline:
+    """Face recognition decoupled from the upload request.
+
+    `submit()` only enqueues the uploaded JPEG and returns. Each camera is
+    pinned to one of `workers` lanes; a lane is a dispatcher thread feeding a
+    single-process pool, so dlib detection and encoding run outside the
+    Flask process and its GIL. Matching against the gallery, logging and the
+    per-camera result that `latest()` serves happen back in this process.
+
+    Pending frames wait in a bounded per-camera slot (see frame_queue.py), so
+    when recognition falls behind, frames are dropped by `drop_policy`
+    instead of piling up and latency stays bounded.
+
+    `process()` runs the same recognition synchronously in the calling
+    thread, for the default in-request ingest mode.
+
+    Faces are tracked per camera (see tracker.py); only new tracks and
+    periodic re-verifications are encoded, and the identity matched for a
+    track is reused for its other frames.
+
+    A lane micro-batches: after its first frame it keeps collecting frames
+    from its other cameras for up to `batch_max_wait` seconds or
+    `batch_max_frames` frames, then encodes and matches all their faces in
+    one worker call and one gallery search, and routes results back per
+    camera. `stats()` reports batch sizes, waits and throughput.
+    """
+
+    def __init__(self, gallery, on_detection, workers=2, tolerance=0.6,
+                 queue_depth=1, drop_policy=DROP_OLDEST, every_nth=1, camera_policies=None,
+                 camera_settings=None, batch_max_wait=0.02, batch_max_frames=8):
+        self.gallery = gallery
+        self.on_detection = on_detection
+        self.workers = workers
+        self.tolerance = tolerance
+        self.queue_options = {
+            'depth': queue_depth,
+            'policy': drop_policy,
+            'every_nth': every_nth,
+            'camera_policies': camera_policies,
+        }
+        self.camera_settings = camera_settings
+        self.batch_max_wait = batch_max_wait
+        self.batch_max_frames = max(1, batch_max_frames)
+        recognition.configure(camera_settings)
+        self.results = {}
+        # camera_id -> {track_id: identity or None} from the last encoding of each track
+        self.track_identities = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self._lanes = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        # Started lazily on the first frame so worker processes that
+        # re-import the app module never spawn pools of their own
+        with self._start_lock:
+            if self._lanes is not None:
+                return
+            lanes = []
+            for i in range(self.workers):
+                lane = {
+                    'id': i,
+                    'frames': FrameQueues(**self.queue_options),
+                    'executor': self._new_executor(),
+                    'stats': {'batches': 0, 'frames': 0, 'faces': 0, 'max_batch': 0,
+                              'wait_ms': 0.0, 'busy_s': 0.0, 'started_at': time.time()},
+                }
+                lane['thread'] = threading.Thread(target=self._run_lane, args=(lane,),
+                                                  name=f"recognition-lane-{i}", daemon=True)
+                lanes.append(lane)
+            self._lanes = lanes
+            for lane in lanes:
+                lane['thread'].start()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=1, initializer=recognition.configure,
+                                   initargs=(self.camera_settings,))
+
+    def _lane_for(self, camera_id):
+        return self._lanes[zlib.crc32(str(camera_id).encode()) % len(self._lanes)]
+
+    def submit(self, camera_id, jpeg_bytes, frame=None):
+        """Queue one uploaded frame for recognition; never blocks on recognition.
+
+        Only the JPEG is needed: the worker decodes it, and detections are
+        logged with the uploaded bytes. `frame` may be None.
+
+        Returns the camera's backlog: whether this frame was accepted and the
+        queued / received / dropped / processed counters.
+        """
+        self.start()
+        accepted, stats = self._lane_for(camera_id)['frames'].put(camera_id, (jpeg_bytes, frame, time.time()))
+        return {'accepted': accepted, **stats}
+
+    def backlog(self, camera_id):
+        if self._lanes is None:
+            return None
+        return self._lane_for(camera_id)['frames'].stats(camera_id)
+
+    def _collect_batch(self, lane):
+        first = lane['frames'].get()
+        if first is None:
+            return None
+        batch = [first]
+        started = time.monotonic()
+        deadline = started + self.batch_max_wait
+        while len(batch) < self.batch_max_frames:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            item = lane['frames'].get(timeout=remaining)
+            if item is None:
+                break
+            batch.append(item)
+        lane['stats']['wait_ms'] += (time.monotonic() - started) * 1000
+        return batch
+
+    def _run_lane(self, lane):
+        while True:
+            batch = self._collect_batch(lane)
+            if batch is None:
+                break
+            jobs = [(camera_id, jpeg_bytes) for camera_id, (jpeg_bytes, _, _) in batch]
+            try:
+                started = time.monotonic()
+                analyses = lane['executor'].submit(analyze_batch, jobs).result()
+                self._publish_batch(batch, analyses)
+                self._record_batch(lane, analyses, time.monotonic() - started)
+            except BrokenProcessPool:
+                print(f"Recognition worker {lane['id']} died, restarting it")
+                lane['executor'] = self._new_executor()
+                # The new worker starts its track ids from scratch; cameras
+                # on the other lanes keep theirs
+                with self.lock:
+                    for camera_id in list(self.track_identities):
+                        if self._lane_for(camera_id) is lane:
+                            del self.track_identities[camera_id]
+            except Exception as e:
+                print(f"Error recognizing frames from {', '.join(sorted({job[0] for job in jobs}))}: {e}")
+
+    def _publish_batch(self, batch, analyses):
+        # One gallery search for every face encoded in the batch
+        counts = [len(analysis['encodings']) for analysis in analyses]
+        matches, face_dict = self.gallery.match(np.concatenate([a['encodings'] for a in analyses]),
+                                                tolerance=self.tolerance)
+        offset = 0
+        for (camera_id, (jpeg_bytes, frame, received_at)), analysis, count in zip(batch, analyses, counts):
+            self._publish(camera_id, analysis, frame, received_at, matches[offset:offset + count], face_dict,
+                          jpeg_bytes=jpeg_bytes)
+            offset += count
+
+    def _record_batch(self, lane, analyses, elapsed):
+        stats = lane['stats']
+        with self.lock:
+            stats['batches'] += 1
+            stats['frames'] += len(analyses)
+            stats['faces'] += sum(len(analysis['encoded']) for analysis in analyses)
+            stats['max_batch'] = max(stats['max_batch'], len(analyses))
+            stats['busy_s'] += elapsed
+
+    def stats(self):
+        """Batching and throughput figures per lane plus per-camera counters"""
+        lanes = []
+        with self.lock:
+            for lane in self._lanes or []:
+                stats = dict(lane['stats'])
+                batches = max(1, stats['batches'])
+                uptime = max(1e-9, time.time() - stats.pop('started_at'))
+                lanes.append({
+                    'lane': lane['id'],
+                    'batches': stats['batches'],
+                    'frames': stats['frames'],
+                    'faces_encoded': stats['faces'],
+                    'avg_batch_frames': round(stats['frames'] / batches, 2),
+                    'max_batch_frames': stats['max_batch'],
+                    'avg_wait_ms': round(stats['wait_ms'] / batches, 2),
+                    'frames_per_s': round(stats['frames'] / uptime, 2),
+                    'faces_per_busy_s': round(stats['faces'] / max(1e-9, stats['busy_s']), 2),
+                })
+            counters = {camera: dict(values) for camera, values in self.counters.items()}
+        backlog = {}
+        for lane in self._lanes or []:
+            backlog.update(lane['frames'].stats())
+        return {'lanes': lanes, 'cameras': counters, 'backlog': backlog}
+
+    def process(self, camera_id, frame, jpeg_bytes=None):
+        """Recognize one frame in the calling thread and return its detected_info"""
+        received_at = time.time()
+        analysis = recognize_faces(camera_id, frame)
+        return self._publish(camera_id, analysis, frame, received_at, jpeg_bytes=jpeg_bytes)['detected_info']
+
+    def _publish(self, camera_id, analysis, frame, received_at, matches=None, face_dict=None, jpeg_bytes=None):
+        if analysis['skipped']:
+            # Nothing moved: the faces from the last processed frame still stand
+            with self.lock:
+                previous = self.results.get(camera_id)
+                result = dict(previous) if previous else {'detected_info': []}
+                processed_at = time.time()
+                result.update(received_at=received_at, processed_at=processed_at, skipped=True,
+                              latency_ms=round((processed_at - received_at) * 1000, 1))
+                self.results[camera_id] = result
+            # Those faces are still in view; reporting them keeps their
+            # sightings open instead of letting them time out and reopen
+            evidence = jpeg_bytes if jpeg_bytes is not None else frame
+            for identity in result['detected_info']:
+                self.on_detection(identity['name'], identity['category'], evidence, camera_id,
+                                  person_id=identity['person_id'], distance=identity['distance'])
+            return result
+
+        if matches is None:
+            matches, face_dict = self.gallery.match(analysis['encodings'], tolerance=self.tolerance)
+
+        with self.lock:
+            identities = self.track_identities.setdefault(camera_id, {})
+            for track_id in analysis['ended_tracks']:
+                identities.pop(track_id, None)
+
+            # Freshly encoded faces get their match; tracked faces reuse
+            # whatever their track was last identified as
+            face_identities = {}
+            for index, match in zip(analysis['encoded'], matches):
+                identity = None
+                if match['matched']:
+                    person_info = face_dict[match['person_id']]
+                    identity = {'person_id': int(match['person_id']),
+                                'name': person_info['name'], 'category': person_info['category'],
+                                'distance': round(match['distance'], 4)}
+                face_identities[index] = identity
+                track_id = analysis['track_ids'][index]
+                if track_id is not None:
+                    identities[track_id] = identity
+            for index, track_id in enumerate(analysis['track_ids']):
+                if index not in face_identities:
+                    face_identities[index] = identities.get(track_id)
+
+            counters = self.counters.setdefault(camera_id, {'frames': 0, 'faces': 0, 'encoded': 0})
+            counters['frames'] += 1
+            counters['faces'] += len(analysis['locations'])
+            counters['encoded'] += len(analysis['encoded'])
+
+        # Detections are logged with the original upload when there is one,
+        # sparing a JPEG encode and keeping its quality
+        evidence = jpeg_bytes if jpeg_bytes is not None else frame
+        detected_info = []
+        for index in range(len(analysis['locations'])):
+            identity = face_identities.get(index)
+            if identity is None:
+                continue
+            detected_info.append({**identity, 'track_id': analysis['track_ids'][index]})
+            self.on_detection(identity['name'], identity['category'], evidence, camera_id,
+                              person_id=identity['person_id'], distance=identity['distance'])
+
+        processed_at = time.time()
+        result = {
+            'detected_info': detected_info,
+            'received_at': received_at,
+            'processed_at': processed_at,
+            'latency_ms': round((processed_at - received_at) * 1000, 1),
+            'skipped': False,
+            'counters': dict(counters),
+        }
+        with self.lock:
+            self.results[camera_id] = result
+        return result
+
+    def latest(self, camera_id):
+        """Most recent recognition result for a camera, or None before its first frame"""
+        with self.lock:
+            return self.results.get(camera_id)
+
+    def shutdown(self):
+        if self._lanes is None:
+            return
+        for lane in self._lanes:
+            lane['frames'].close()
+        for lane in self._lanes:
+            lane['thread'].join()
+            lane['executor'].shutdown()
@@ -0,0 +1,222 @@
+import threading
+import dlib
+import face_recognition
+import numpy as np
+import cv2
+from motion import MotionGate
+from tracker import FaceTracker
+
+# Per-camera recognition settings; 'default' applies to every camera and
+# entries keyed by camera id override individual values
+DEFAULT_CAMERA_SETTINGS = {
+    'motion_gating': True,
+    'motion_threshold': 25,        # grey levels a pixel must change by
+    'motion_min_changed': 0.002,   # fraction of pixels that must change
+    'force_detect_every': 30,      # full detection at least every N frames
+    'motion_regions': True,        # only scan the regions that changed
+    'tracking': True,              # reuse identities of faces tracked across frames
+    'track_iou': 0.3,              # minimum box overlap to continue a track
+    'track_max_missed': 5,         # frames a face may vanish before its track ends
+    'reverify_every': 15,          # re-encode tracked faces every N frames
+    'detection_scale': 1.0,        # resize factor applied before HOG detection
+    'detection_upsample': 1,       # face_locations upsample count
+    'min_face_size': 0,            # drop faces smaller than this many pixels
+}
+CAMERA_SETTINGS = {'default': dict(DEFAULT_CAMERA_SETTINGS)}
+
+_camera_states = {}
+_states_lock = threading.Lock()
+
+
+def configure(camera_settings):
+    """Install per-camera settings; also used as the worker process initializer"""
+    global CAMERA_SETTINGS
+    settings = {'default': dict(DEFAULT_CAMERA_SETTINGS)}
+    for camera_id, overrides in (camera_settings or {}).items():
+        settings.setdefault(camera_id, {}).update(overrides)
+    CAMERA_SETTINGS = settings
+    with _states_lock:
+        _camera_states.clear()
+
+
+def camera_settings(camera_id):
+    settings = dict(CAMERA_SETTINGS['default'])
+    settings.update(CAMERA_SETTINGS.get(camera_id, {}))
+    return settings
+
+
+class CameraState:
+    """Recognition state kept between frames of one camera"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.motion_gate = MotionGate(threshold=settings['motion_threshold'],
+                                      min_changed=settings['motion_min_changed'],
+                                      force_every=settings['force_detect_every'])
+        self.tracker = None
+        if settings['tracking']:
+            self.tracker = FaceTracker(iou_threshold=settings['track_iou'],
+                                       max_missed=settings['track_max_missed'],
+                                       reverify_every=settings['reverify_every'])
+
+
+def camera_state(camera_id):
+    with _states_lock:
+        state = _camera_states.get(camera_id)
+        if state is None:
+            state = _camera_states[camera_id] = CameraState(camera_settings(camera_id))
+        return state
+
+
+def decode_frame(jpeg_bytes):
+    nparr = np.frombuffer(jpeg_bytes, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def detect_faces(rgb_frame, regions=None, scale=1.0, upsample=1, min_face_size=0):
+    """Face boxes in full-resolution coordinates.
+
+    Detection optionally only searches inside `regions` and runs on a copy
+    resized by `scale`; boxes are projected back to the original frame so
+    encodings are still computed from the full-resolution pixels. Faces
+    smaller than `min_face_size` pixels are dropped.
+    """
+    height, width = rgb_frame.shape[:2]
+    if regions is None:
+        regions = [(0, width, height, 0)]
+    locations = []
+    for top, right, bottom, left in regions:
+        crop = rgb_frame[top:bottom, left:right]
+        if crop.size == 0:
+            continue
+        if scale != 1.0:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        for t, r, b, l in face_recognition.face_locations(crop, number_of_times_to_upsample=upsample):
+            box = (max(0, int(round(t / scale)) + top),
+                   min(width, int(round(r / scale)) + left),
+                   min(height, int(round(b / scale)) + top),
+                   max(0, int(round(l / scale)) + left))
+            if min(box[2] - box[0], box[1] - box[3]) >= min_face_size:
+                locations.append(box)
+    return locations
+
+
+def skipped_analysis(camera_id):
+    return {
+        'camera_id': camera_id,
+        'skipped': True,
+        'motion': None,
+        'locations': [],
+        'track_ids': [],
+        'encoded': [],
+        'encodings': np.empty((0, 128)),
+        'ended_tracks': [],
+    }
+
+
+def prepare_faces(camera_id, frame):
+    """Motion-gate, detect and track the faces in one BGR frame from `camera_id`.
+
+    Returns (analysis, rgb_frame). The analysis dict holds the face
+    `locations`, their `track_ids`, the indices of the faces that must be
+    `encoded` this frame, the `ended_tracks`, and `skipped`, which is True
+    when the motion gate decided nothing changed and detection was not run.
+    With tracking on, faces continuing an existing track are not re-encoded.
+    """
+    state = camera_state(camera_id)
+    with state.lock:
+        regions = None
+        changed = None
+        if state.settings['motion_gating']:
+            detect, regions, changed = state.motion_gate.check(frame)
+            if not detect:
+                analysis = skipped_analysis(camera_id)
+                analysis['motion'] = changed
+                return analysis, None
+            if not state.settings['motion_regions']:
+                regions = None
+
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    face_locations = detect_faces(rgb_frame, regions,
+                                  scale=state.settings['detection_scale'],
+                                  upsample=state.settings['detection_upsample'],
+                                  min_face_size=state.settings['min_face_size'])
+    if state.tracker is not None:
+        with state.lock:
+            track_ids, encoded, ended_tracks = state.tracker.update(face_locations)
+    else:
+        track_ids, encoded, ended_tracks = [None] * len(face_locations), list(range(len(face_locations))), []
+
+    return {
+        'camera_id': camera_id,
+        'skipped': False,
+        'motion': changed,
+        'locations': face_locations,
+        'track_ids': track_ids,
+        'encoded': encoded,
+        'encodings': np.empty((0, 128)),
+        'ended_tracks': ended_tracks,
+    }, rgb_frame
+
+
+def encode_faces(rgb_frames, locations_per_frame):
+    """128-d encodings for the given boxes of several frames in one dlib call.
+
+    Uses dlib's batched compute_face_descriptor over a list of images and
+    falls back to one face_recognition.face_encodings call per frame on dlib
+    builds without it. Returns one (n, 128) array per frame.
+    """
+    results = [np.empty((0, 128)) for _ in rgb_frames]
+    pending = [i for i, locations in enumerate(locations_per_frame) if locations]
+    if not pending:
+        return results
+    try:
+        batch_images, batch_shapes = [], []
+        for i in pending:
+            shapes = dlib.full_object_detections()
+            for shape in face_recognition.api._raw_face_landmarks(rgb_frames[i], locations_per_frame[i], model='small'):
+                shapes.append(shape)
+            batch_images.append(rgb_frames[i])
+            batch_shapes.append(shapes)
+        descriptors = face_recognition.api.face_encoder.compute_face_descriptor(batch_images, batch_shapes, 1)
+        for i, frame_descriptors in zip(pending, descriptors):
+            results[i] = np.array([np.array(d) for d in frame_descriptors], dtype=np.float64).reshape(-1, 128)
+    except (AttributeError, TypeError, RuntimeError):
+        for i in pending:
+            encodings = face_recognition.face_encodings(rgb_frames[i], locations_per_frame[i])
+            results[i] = np.array(encodings, dtype=np.float64).reshape(-1, 128)
+    return results
+
+
+def recognize_faces(camera_id, frame):
+    """Detect, track and encode the faces in one BGR frame (see prepare_faces)"""
+    analysis, rgb_frame = prepare_faces(camera_id, frame)
+    if not analysis['skipped']:
+        boxes = [analysis['locations'][i] for i in analysis['encoded']]
+        analysis['encodings'] = encode_faces([rgb_frame], [boxes])[0]
+    return analysis
+
+
+def analyze_batch(jobs):
+    """Worker entry point: recognize a batch of uploaded frames from one or more cameras.
+
+    `jobs` is a list of (camera_id, jpeg_bytes). Runs inside a recognition
+    worker process, so only compact JPEGs go in and only face boxes and
+    encodings come back out. Faces from all frames are encoded together.
+    """
+    analyses, rgb_frames, boxes = [], [], []
+    for camera_id, jpeg_bytes in jobs:
+        frame = decode_frame(jpeg_bytes)
+        if frame is None:
+            # Undecodable upload: treated like a frame where nothing changed
+            analysis, rgb_frame = skipped_analysis(camera_id), None
+            analysis['error'] = 'could not decode frame'
+        else:
+            analysis, rgb_frame = prepare_faces(camera_id, frame)
+        analyses.append(analysis)
+        rgb_frames.append(rgb_frame)
+        boxes.append([analysis['locations'][i] for i in analysis['encoded']])
+    for analysis, encodings in zip(analyses, encode_faces(rgb_frames, boxes)):
+        analysis['encodings'] = encodings
+    return analyses
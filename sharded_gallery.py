@@ -0,0 +1,234 @@
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from database import ensure_gallery_version, get_gallery_version
+from gallery import DB_PATH, FaceGallery
+from matcher import DEFAULT_TOLERANCE, DEFAULT_TOP_K, rank_people
+
+# The shard's slice of the gallery, held by each shard worker process
+_shard = None
+
+
+def shard_for(person_id, shards):
+    # Same partitioning as the `person_id % count` filter in FaceGallery.reload
+    return int(person_id) % shards
+
+
+def _init_shard(db_path, shard, shards, templates):
+    global _shard
+    _shard = FaceGallery(db_path, shard=(shard, shards), templates=templates)
+
+
+def _shard_reload():
+    _shard.reload()
+    return len(_shard)
+
+
+def _shard_add(person_id, name, category, encodings):
+    # The coordinator tracks the gallery version for the shards
+    _shard._add_person(person_id, name, category, encodings)
+    return len(_shard)
+
+
+def _shard_search(probes, top_k):
+    # Candidates only: the coordinator applies the tolerance after merging
+    results, _ = _shard.match(probes, top_k=top_k)
+    return [result['candidates'] for result in results]
+
+
+def merge_candidates(shard_candidates, face_dict, top_k=DEFAULT_TOP_K, tolerance=DEFAULT_TOLERANCE):
+    """Merge per-shard top-k candidate lists into one result dict per probe.
+
+    Every person lives in exactly one shard, so the overall top-k is the
+    top-k of the shard lists put together. Candidates missing from
+    `face_dict` (deleted while a shard was still reloading) are dropped.
+    """
+    merged = [[(person_id, distance) for candidates in per_probe for person_id, distance in candidates
+               if person_id in face_dict]
+              for per_probe in zip(*shard_candidates)]
+    found = np.unique(np.array([person_id for candidates in merged for person_id, _ in candidates],
+                               dtype=np.int64))
+    per_person = np.full((len(merged), len(found)), np.inf)
+    for i, candidates in enumerate(merged):
+        for person_id, distance in candidates:
+            per_person[i, np.searchsorted(found, person_id)] = distance
+    return rank_people(found, per_person, top_k, tolerance)
+
+
+class ShardedGallery(FaceGallery):
+    """Face gallery partitioned across `shards` worker processes.
+
+    Each shard is a single-process pool holding the encodings of the people
+    with `person_id % shards` equal to its number, so an exact scan of a
+    large gallery is split across cores instead of being bound to one
+    process and its GIL. `match()` scatters the probes to every shard,
+    gathers each shard's top-k people and merges them; the results are the
+    same as a single FaceGallery's exact scan.
+
+    The coordinator keeps only the person metadata. An enrollment is sent
+    to the shard that owns the person; `refresh_if_stale()` reloads every
+    shard when the database gallery version moves on. With `templates` each
+    shard searches per-person templates (see face_templates.py).
+    """
+
+    def __init__(self, db_path=DB_PATH, shards=4, templates=False):
+        super().__init__(db_path, templates=templates)
+        self.shards = max(1, shards)
+        self.shard_sizes = [0] * self.shards
+        self.executors = None
+        self.searches = 0
+        self.search_s = 0.0
+        self._start_lock = threading.Lock()
+
+    def __len__(self):
+        return sum(self.shard_sizes)
+
+    def start(self):
+        # Worker processes that re-import the app module must not spawn
+        # shards of their own
+        if multiprocessing.parent_process() is not None:
+            return False
+        with self._start_lock:
+            if self.executors is None:
+                self.executors = [self._new_executor(i) for i in range(self.shards)]
+        return True
+
+    def _new_executor(self, shard):
+        return ProcessPoolExecutor(max_workers=1, initializer=_init_shard,
+                                   initargs=(self.db_path, shard, self.shards, self.use_templates))
+
+    def _result(self, shard, future):
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # The shard's encodings went with it; clearing the version makes
+            # the next refresh reload the restarted shard
+            print(f"Gallery shard {shard} died, restarting it")
+            self.executors[shard] = self._new_executor(shard)
+            self.version = None
+            return None
+
+    def _gather(self, futures):
+        return [self._result(shard, future) for shard, future in enumerate(futures)]
+
+    def reload(self):
+        """Reload the person metadata here and every shard's encodings in its process"""
+        if not self.start():
+            return False
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            ensure_gallery_version(cursor)
+            conn.commit()
+            version = get_gallery_version(cursor)
+            cursor.execute("SELECT id, name, category FROM known_faces")
+            face_rows = cursor.fetchall()
+            conn.close()
+        except sqlite3.OperationalError as e:
+            print(f"Error loading face gallery: {e}")
+            return False
+
+        face_dict = {row[0]: {'name': row[1], 'category': row[2]} for row in face_rows}
+        # Newly enrolled people must be known before any shard can return them
+        with self.lock:
+            self.face_dict = {**self.face_dict, **face_dict}
+        sizes = self._gather([executor.submit(_shard_reload) for executor in self.executors])
+        with self.lock:
+            self.face_dict = face_dict
+            self.shard_sizes = [size or 0 for size in sizes]
+            self.version = version if None not in sizes else None
+        print(f"Face gallery loaded into {self.shards} shards: {len(self)} encodings for {len(face_dict)} people")
+        return True
+
+    def load(self):
+        return self.reload()
+
+    def add_person(self, person_id, name, category, encodings):
+        """Register a newly enrolled person and append their encodings to the owning shard"""
+        if not self.start():
+            return
+        with self._refresh_lock:
+            with self.lock:
+                self.face_dict[person_id] = {'name': name, 'category': category}
+            shard = shard_for(person_id, self.shards)
+            encodings = np.asarray(encodings, dtype=np.float64)
+            size = self._result(shard, self.executors[shard].submit(_shard_add, person_id, name, category, encodings))
+            if size is not None:
+                self.shard_sizes[shard] = size
+            self._advance_version(len(encodings))
+
+    def match(self, probes, top_k=DEFAULT_TOP_K, tolerance=DEFAULT_TOLERANCE):
+        """Scatter the probes to every shard and merge their results, returning (results, face_dict)"""
+        with self.lock:
+            face_dict = self.face_dict
+        if len(probes) == 0 or not self.start():
+            return [], face_dict
+        started = time.perf_counter()
+        probes = np.asarray(probes, dtype=np.float64)
+        # Each shard returns at least two people so the merged margin to the
+        # runner-up is exact even for top_k=1
+        shard_top_k = max(top_k, 2)
+        shard_candidates = self._gather([executor.submit(_shard_search, probes, shard_top_k)
+                                         for executor in self.executors])
+        shard_candidates = [candidates if candidates is not None else [[] for _ in probes]
+                            for candidates in shard_candidates]
+        results = merge_candidates(shard_candidates, face_dict, top_k, tolerance)
+        with self.lock:
+            self.searches += 1
+            self.search_s += time.perf_counter() - started
+        return results, face_dict
+
+    def stats(self):
+        with self.lock:
+            return {
+                'shards': self.shards,
+                'shard_encodings': list(self.shard_sizes),
+                'searches': self.searches,
+                'avg_search_ms': round(self.search_s * 1000 / max(1, self.searches), 2),
+            }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare sharded gallery search throughput against a single in-process gallery")
+    parser.add_argument('--db', default=DB_PATH, help="Path to the SQLite database")
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4], help="Shard counts to evaluate")
+    parser.add_argument('--probes', type=int, default=8, help="Probe encodings per search")
+    parser.add_argument('--searches', type=int, default=100, help="Searches per configuration")
+    args = parser.parse_args()
+
+    single = FaceGallery(args.db)
+    single.reload()
+    if len(single) == 0:
+        raise SystemExit("The gallery is empty")
+    rng = np.random.default_rng(0)
+    queries = [single.encodings[rng.integers(0, len(single), args.probes)]
+               + rng.normal(0, 0.02, (args.probes, single.encodings.shape[1]))
+               for _ in range(args.searches)]
+
+    started = time.perf_counter()
+    expected = [single.match(probes)[0] for probes in queries]
+    elapsed = time.perf_counter() - started
+    print(f"single: {args.searches / elapsed:.1f} searches/s over {len(single)} encodings")
+
+    for shards in args.shards:
+        gallery = ShardedGallery(args.db, shards=shards)
+        gallery.reload()
+        # Warm the shard processes before timing
+        gallery.match(queries[0])
+        # Searches from concurrent recognition lanes overlap across the shards
+        with ThreadPoolExecutor(max_workers=shards) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(lambda probes: gallery.match(probes)[0], queries))
+            elapsed = time.perf_counter() - started
+        agree = sum(got[i]['person_id'] == want[i]['person_id']
+                    for got, want in zip(results, expected) for i in range(len(want)))
+        print(f"shards={shards}: {args.searches / elapsed:.1f} searches/s, "
+              f"{agree}/{args.searches * args.probes} best matches agree with the single gallery")
+        for executor in gallery.executors:
+            executor.shutdown()
@@ -0,0 +1,130 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+
+
+def _timestamp(seconds):
+    # Same format as the detection_events.time default
+    return datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Sighting:
+    """One person continuously seen at one location"""
+
+    def __init__(self, person_id, name, category, location, now, distance):
+        self.person_id = person_id
+        self.name = name
+        self.category = category
+        self.location = location
+        self.first_seen = now
+        self.last_seen = now
+        self.frame_count = 1
+        self.best_distance = distance
+        # Frame that beat the stored one and has not been written yet
+        self.best_frame = None
+        self.last_written = now
+        self.written_count = 1
+        self.row_id = None
+
+    def values(self):
+        return (self.person_id, self.name, self.category, self.location, _timestamp(self.first_seen),
+                _timestamp(self.last_seen), self.frame_count, self.best_distance)
+
+
+class SightingAggregator:
+    """Collapses repeated matches of a person at a location into one sighting.
+
+    The first match of (person, location) opens a sighting and writes its
+    row; further matches only extend it in memory, keeping the frame with
+    the smallest match distance. A sighting closes once the person has not
+    been seen for `gap` seconds, when its final last_seen, frame_count and
+    best frame are written. Long sightings are also rewritten every
+    `update_every` seconds so the log stays current. A person in view for
+    30 seconds at 5 fps is thus two writes instead of 150.
+    """
+
+    def __init__(self, writer, gap=10.0, update_every=30.0, sweep_interval=1.0):
+        self.writer = writer
+        self.gap = gap
+        self.update_every = update_every
+        self.sweep_interval = sweep_interval
+        self.open = {}
+        self.opened = 0
+        self.closed = 0
+        self.observations = 0
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="sighting-sweeper", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def observe(self, person_id, name, category, location, frame, distance=None):
+        """Record one match; returns True when it opened a new sighting"""
+        self.start()
+        now = time.time()
+        key = (person_id if person_id is not None else name, location)
+        with self.lock:
+            self.observations += 1
+            sighting = self.open.get(key)
+            if sighting is not None and now - sighting.last_seen > self.gap:
+                self._close(key, sighting)
+                sighting = None
+
+            if sighting is None:
+                sighting = self.open[key] = Sighting(person_id, name, category, location, now, distance)
+                self.opened += 1
+                self.writer.open_sighting(sighting, frame)
+                return True
+
+            sighting.last_seen = now
+            sighting.frame_count += 1
+            if distance is not None and (sighting.best_distance is None or distance < sighting.best_distance):
+                sighting.best_distance = distance
+                sighting.best_frame = frame
+            if now - sighting.last_written >= self.update_every:
+                self._write(sighting, now)
+            return False
+
+    def _write(self, sighting, now):
+        self.writer.update_sighting(sighting, sighting.best_frame)
+        sighting.best_frame = None
+        sighting.last_written = now
+        sighting.written_count = sighting.frame_count
+
+    def _close(self, key, sighting):
+        if sighting.frame_count != sighting.written_count or sighting.best_frame is not None:
+            self._write(sighting, time.time())
+        del self.open[key]
+        self.closed += 1
+
+    def sweep(self):
+        """Close every sighting not seen for `gap` seconds"""
+        now = time.time()
+        with self.lock:
+            for key, sighting in list(self.open.items()):
+                if now - sighting.last_seen > self.gap:
+                    self._close(key, sighting)
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
+
+    def close(self):
+        """Close all open sightings and flush them through the writer"""
+        self._stop.set()
+        with self.lock:
+            for key, sighting in list(self.open.items()):
+                self._close(key, sighting)
+        self.writer.close()
+
+    def stats(self):
+        with self.lock:
+            return {'open': len(self.open), 'opened': self.opened, 'closed': self.closed,
+                    'observations': self.observations}
@@ -0,0 +1,119 @@
+import argparse
+import http.client
+import json
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+import cv2
+from stream_ingest import pack_frame
+
+
+class StreamClient:
+    """Reference client for the /ingest/<camera_id> streaming endpoint.
+
+    Opens one long-lived chunked POST and writes each JPEG as a
+    length-prefixed frame on it; a background thread reads the server's JSON
+    result lines from the response on the same connection and hands them to
+    `on_result`. The socket is driven directly because http.client cannot
+    read a response while the request body is still being sent.
+    """
+
+    def __init__(self, server, camera_id, on_result=None, timeout=30):
+        url = urlsplit(server)
+        self.https = url.scheme == 'https'
+        self.host = url.hostname
+        self.port = url.port or (443 if self.https else 80)
+        self.path = f"{url.path.rstrip('/')}/ingest/{camera_id}"
+        self.timeout = timeout
+        self.on_result = on_result or (lambda result: None)
+        self.sock = None
+        self.sent = 0
+        self.received = 0
+        self.reader = None
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.https:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        # The timeout only guards connecting; a camera may pause for a while
+        sock.settimeout(None)
+        self.sock = sock
+        self.sock.sendall((f"POST {self.path} HTTP/1.1\r\n"
+                           f"Host: {self.host}:{self.port}\r\n"
+                           "Content-Type: application/octet-stream\r\n"
+                           "Transfer-Encoding: chunked\r\n\r\n").encode())
+        self.reader = threading.Thread(target=self._read_results, name="ingest-results", daemon=True)
+        self.reader.start()
+
+    def _read_results(self):
+        response = http.client.HTTPResponse(self.sock, method='POST')
+        response.begin()
+        if response.status != 200:
+            print(f"Ingest rejected: {response.status} {response.reason}")
+            return
+        for line in response:
+            if line.strip():
+                self.received += 1
+                self.on_result(json.loads(line))
+
+    def _send_chunk(self, data):
+        self.sock.sendall(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+    def send(self, jpeg_bytes):
+        self._send_chunk(pack_frame(jpeg_bytes))
+        self.sent += 1
+
+    def close(self):
+        """End the frame stream and wait for the remaining results"""
+        self._send_chunk(pack_frame(b''))
+        self.sock.sendall(b"0\r\n\r\n")
+        if self.reader is not None:
+            self.reader.join()
+        self.sock.close()
+
+
+def open_source(source):
+    # A camera index such as "0", otherwise a video file or stream URL
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream camera frames to the recognition server over one connection")
+    parser.add_argument('server', help="Server URL, e.g. http://localhost:5000")
+    parser.add_argument('camera_id', help="Camera / location id")
+    parser.add_argument('--source', default='0', help="Camera index, video file or stream URL")
+    parser.add_argument('--fps', type=float, default=10, help="Frames sent per second")
+    parser.add_argument('--quality', type=int, default=80, help="JPEG quality")
+    parser.add_argument('--frames', type=int, default=0, help="Stop after this many frames (0 = until the source ends)")
+    args = parser.parse_args()
+
+    def show(result):
+        detections = result.get('detected_info', result.get('detections', []))
+        if detections:
+            print(f"frame {result['frame']}: {detections}")
+
+    capture = open_source(args.source)
+    client = StreamClient(args.server, args.camera_id, on_result=show)
+    client.connect()
+    started = time.perf_counter()
+    try:
+        while not args.frames or client.sent < args.frames:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+            if ok:
+                client.send(jpeg.tobytes())
+            delay = started + client.sent / args.fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.release()
+        client.close()
+    elapsed = time.perf_counter() - started
+    print(f"Sent {client.sent} frames in {elapsed:.1f}s ({client.sent / max(elapsed, 1e-9):.1f} fps), "
+          f"{client.received} results")
@@ -0,0 +1,57 @@
+import json
+import struct
+
+# Each frame on an ingest stream is a 4-byte big-endian length followed by
+# that many bytes of JPEG; a zero length ends the stream
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+
+def pack_frame(jpeg_bytes):
+    return FRAME_HEADER.pack(len(jpeg_bytes)) + jpeg_bytes
+
+
+def _read_exactly(stream, size):
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frames(stream, max_frame_bytes=MAX_FRAME_BYTES):
+    """Yield the JPEGs of a length-prefixed frame stream until it ends"""
+    while True:
+        header = _read_exactly(stream, FRAME_HEADER.size)
+        if header is None:
+            return
+        (size,) = FRAME_HEADER.unpack(header)
+        if size == 0:
+            return
+        if size > max_frame_bytes:
+            raise ValueError(f"frame of {size} bytes exceeds the {max_frame_bytes} byte limit")
+        data = _read_exactly(stream, size)
+        if data is None:
+            return
+        yield data
+
+
+def ingest_stream(stream, camera_id, handle_frame):
+    """Response body for a streaming ingest connection.
+
+    Reads frames from the request `stream` as they arrive, passes each to
+    `handle_frame(camera_id, jpeg_bytes)`, which returns (payload, status)
+    like an upload would, and writes one JSON line per frame back on the
+    same connection.
+    """
+    sequence = 0
+    try:
+        for jpeg_bytes in read_frames(stream):
+            sequence += 1
+            payload, status = handle_frame(camera_id, jpeg_bytes)
+            yield json.dumps({'frame': sequence, 'code': status, **payload}) + "\n"
+    except ValueError as e:
+        yield json.dumps({'frame': sequence + 1, 'code': 400, 'status': 'error', 'message': str(e)}) + "\n"
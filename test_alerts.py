@@ -0,0 +1,77 @@
+import json
+import time
+from alerts import AlertDispatcher, FakeTransport
+
+
+class _Flaky(FakeTransport):
+    """Fails the first `failures` sends, then delivers"""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.attempts = 0
+
+    def send(self, to, body):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise RuntimeError("transient failure")
+        super().send(to, body)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _dead_letters(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_transient_failure_is_retried_until_sent(tmp_path):
+    transport = _Flaky(failures=2)
+    dispatcher = AlertDispatcher(transport, workers=1, base_delay=0.01, max_delay=0.02,
+                                 dead_letter_path=str(tmp_path / 'dead.jsonl'))
+    assert dispatcher.submit('+100', "alert")
+    _wait_for(lambda: transport.sent)
+    dispatcher.close()
+
+    assert [(to, body) for to, body, _ in transport.sent] == [('+100', "alert")]
+    stats = dispatcher.stats()
+    assert (stats['sent'], stats['retried'], stats['dead_lettered']) == (1, 2, 0)
+    assert not (tmp_path / 'dead.jsonl').exists()
+
+
+def test_exhausted_retries_go_to_the_dead_letter_file(tmp_path):
+    path = str(tmp_path / 'dead.jsonl')
+    dispatcher = AlertDispatcher(FakeTransport(failure_rate=1.0), workers=1, max_attempts=3,
+                                 base_delay=0.01, max_delay=0.02, dead_letter_path=path)
+    dispatcher.submit('+100', "alert")
+    _wait_for(lambda: dispatcher.stats()['dead_lettered'] == 1)
+    dispatcher.close()
+
+    [letter] = _dead_letters(path)
+    assert (letter['to'], letter['body'], letter['attempts']) == ('+100', "alert", 3)
+    assert letter['error'] == "simulated delivery failure"
+    assert dispatcher.stats()['retried'] == 2
+
+
+def test_close_delivers_the_queue_and_dead_letters_pending_retries(tmp_path):
+    path = str(tmp_path / 'dead.jsonl')
+    transport = FakeTransport(latency=0.01)
+    dispatcher = AlertDispatcher(transport, workers=2, dead_letter_path=path)
+    for i in range(10):
+        dispatcher.submit('+100', f"alert {i}")
+    dispatcher.close()
+    assert sorted(body for _, body, _ in transport.sent) == sorted(f"alert {i}" for i in range(10))
+
+    # A retry far in the future is not waited for
+    retrying = AlertDispatcher(_Flaky(failures=1), workers=1, base_delay=60, dead_letter_path=path)
+    retrying.submit('+100', "late alert")
+    _wait_for(lambda: retrying.stats()['waiting_retry'] == 1)
+    retrying.close()
+    [letter] = _dead_letters(path)
+    assert letter['body'] == "late alert"
+    assert letter['error'].startswith("shutdown before retry")
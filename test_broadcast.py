@@ -0,0 +1,32 @@
+import time
+import numpy as np
+from broadcast import FrameBroadcaster
+
+
+def test_idle_stream_produces_output_within_keepalive():
+    broadcaster = FrameBroadcaster(keepalive=0.1)
+    stream = broadcaster.stream('cam1')
+    started = time.monotonic()
+    assert next(stream) == b'\r\n'
+    assert time.monotonic() - started < 0.5
+
+    broadcaster.publish('cam1', jpeg=b'jpeg-bytes')
+    first = next(stream)
+    assert first.endswith(b'jpeg-bytes\r\n')
+    # No new frame: the last one is sent again after the keepalive
+    started = time.monotonic()
+    assert next(stream) == first
+    assert 0.05 < time.monotonic() - started < 0.5
+
+    assert broadcaster.stats()['cam1']['viewers'] == 1
+    stream.close()
+    assert broadcaster.stats()['cam1']['viewers'] == 0
+
+
+def test_each_frame_is_encoded_once_for_every_viewer():
+    broadcaster = FrameBroadcaster(keepalive=0.1)
+    streams = [broadcaster.stream('cam1') for _ in range(3)]
+    broadcaster.publish('cam1', frame=np.zeros((8, 8, 3), dtype=np.uint8))
+    parts = [next(stream) for stream in streams]
+    assert len(set(parts)) == 1 and parts[0].startswith(b'--frame\r\n')
+    assert broadcaster.stats()['cam1']['encodes'] == 1
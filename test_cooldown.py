@@ -0,0 +1,65 @@
+import sqlite3
+import cooldown
+from cooldown import CooldownStore
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def _keys(db_path):
+    conn = sqlite3.connect(db_path)
+    keys = [row[0] for row in conn.execute("SELECT key FROM alert_cooldowns ORDER BY key")]
+    conn.close()
+    return keys
+
+
+def test_alert_is_suppressed_inside_the_window_and_allowed_after(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cooldown.time, 'time', clock.time)
+    store = CooldownStore(str(tmp_path / 'record.db'), default_cooldown=60, category_cooldowns={'criminal': 10})
+
+    assert store.should_alert('cam1|7')
+    clock.now += 59
+    assert not store.should_alert('cam1|7')
+    # The suppressed attempt did not restart the window
+    clock.now += 1
+    assert store.should_alert('cam1|7')
+
+    assert store.should_alert('cam1|8', category='criminal')
+    clock.now += 10
+    assert store.should_alert('cam1|8', category='criminal')
+
+
+def test_stores_sharing_a_database_share_cooldowns(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cooldown.time, 'time', clock.time)
+    db_path = str(tmp_path / 'record.db')
+    first = CooldownStore(db_path, default_cooldown=60)
+    second = CooldownStore(db_path, default_cooldown=60)
+
+    assert first.should_alert('cam1|7')
+    assert not second.should_alert('cam1|7')
+    assert second.should_alert('cam2|7')
+    clock.now += 60
+    assert second.should_alert('cam1|7')
+    assert not first.should_alert('cam1|7')
+
+
+def test_eviction_drops_expired_keys_then_those_closest_to_expiring(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cooldown.time, 'time', clock.time)
+    db_path = str(tmp_path / 'record.db')
+    store = CooldownStore(db_path, location_cooldowns={'a': 5, 'b': 30, 'c': 20, 'd': 40},
+                          max_entries=2, evict_every=3600)
+    for location in 'abcd':
+        store.should_alert(location, location=location)
+
+    clock.now += 10
+    store.evict()
+    # 'a' had expired; of the rest, 'c' expires soonest and goes to fit max_entries
+    assert _keys(db_path) == ['b', 'd']
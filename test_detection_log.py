@@ -0,0 +1,78 @@
+import sqlite3
+import pytest
+from database import init_db
+from detection_log import DetectionWriter, decode_cursor, encode_cursor, fetch_detections
+from sightings import Sighting
+
+
+def test_batched_opens_get_their_own_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    init_db()
+    writer = DetectionWriter(str(tmp_path / 'record.db'), flush_interval=0.2)
+    sightings = [Sighting(person_id, f"person {person_id}", 'other', 'cam1', 1000.0 + person_id, 0.4)
+                 for person_id in (1, 2, 3)]
+    # Opens and updates of the same sightings land in one batch
+    for sighting in sightings:
+        writer.open_sighting(sighting, b'jpeg')
+    for sighting in sightings:
+        sighting.frame_count = sighting.person_id * 10
+        writer.update_sighting(sighting)
+    writer.close()
+
+    assert writer.stats()['batches'] == 1
+    conn = sqlite3.connect(tmp_path / 'record.db')
+    rows = conn.execute("SELECT id, person_id, frame_count FROM detection_events ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [(sighting.row_id, sighting.person_id, sighting.person_id * 10) for sighting in sightings]
+
+
+def _events(tmp_path, monkeypatch, rows):
+    monkeypatch.chdir(tmp_path)
+    init_db()
+    conn = sqlite3.connect('record.db')
+    with conn:
+        conn.executemany('''
+            INSERT INTO detection_events (person_name, category, last_location, time, detected_frame)
+            VALUES (?, ?, ?, ?, x'')
+        ''', rows)
+    return conn
+
+
+def _pages(conn, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        events, cursor = fetch_detections(conn, cursor=cursor, limit=limit, **filters)
+        pages.append([event['id'] for event in events])
+        if cursor is None:
+            return pages
+
+
+def test_pages_split_events_with_equal_timestamps(tmp_path, monkeypatch):
+    # Five events in the same second, then two older ones
+    conn = _events(tmp_path, monkeypatch, [('ann', 'other', 'cam1', '2026-01-01 10:00:00')] * 2
+                   + [('ann', 'other', 'cam1', '2026-01-01 10:00:05')] * 5)
+    assert _pages(conn, 2) == [[7, 6], [5, 4], [3, 2], [1]]
+    assert _pages(conn, 7) == [[7, 6, 5, 4, 3, 2, 1]]
+    conn.close()
+
+
+def test_every_filter_is_kept_across_pages(tmp_path, monkeypatch):
+    rows = [(name, category, location, f"2026-01-01 10:00:{second:02d}")
+            for second, (name, category, location) in enumerate(
+                [('ann', 'suspect', 'cam1'), ('bob', 'suspect', 'cam2'), ('ann', 'other', 'cam2'),
+                 ('ann', 'suspect', 'cam2'), ('bob', 'other', 'cam1'), ('ann', 'suspect', 'cam1')])]
+    conn = _events(tmp_path, monkeypatch, rows)
+    assert _pages(conn, 1, person='ann') == [[6], [4], [3], [1]]
+    assert _pages(conn, 1, category='suspect') == [[6], [4], [2], [1]]
+    assert _pages(conn, 1, location='cam2') == [[4], [3], [2]]
+    assert _pages(conn, 1, person='ann', category='suspect', location='cam1') == [[6], [1]]
+    conn.close()
+
+
+def test_malformed_cursor_is_rejected(tmp_path, monkeypatch):
+    assert decode_cursor(encode_cursor('2026-01-01 10:00:00', 3)) == ('2026-01-01 10:00:00', 3)
+    conn = _events(tmp_path, monkeypatch, [])
+    for cursor in ('no-separator', '2026-01-01 10:00:00|three'):
+        with pytest.raises(ValueError):
+            fetch_detections(conn, cursor=cursor)
+    conn.close()
@@ -0,0 +1,50 @@
+import pickle
+import numpy as np
+import pytest
+from encoding_format import HEADER, MAGIC, is_packed, pack_encoding, unpack_encoding, unpack_many
+
+
+def _encodings(count):
+    return np.random.default_rng(0).normal(0, 0.1, (count, 128))
+
+
+def test_packed_encoding_round_trips():
+    encoding = _encodings(1)[0]
+    blob = pack_encoding(encoding)
+    assert blob[:4] == MAGIC and is_packed(blob)
+    assert len(blob) == HEADER.size + 128 * 4
+    np.testing.assert_allclose(unpack_encoding(blob), encoding, rtol=1e-6)
+
+    exact = pack_encoding(encoding, dtype=np.float64)
+    assert np.array_equal(unpack_encoding(exact), encoding)
+
+
+def test_legacy_pickle_blob_is_still_read():
+    encoding = _encodings(1)[0]
+    blob = pickle.dumps(encoding)
+    assert not is_packed(blob)
+    assert np.array_equal(unpack_encoding(blob), encoding)
+
+
+def test_unknown_format_version_is_rejected():
+    blob = bytearray(pack_encoding(_encodings(1)[0]))
+    blob[4] = 99
+    with pytest.raises(ValueError):
+        unpack_encoding(bytes(blob))
+
+
+def test_unpack_many_handles_packed_and_mixed_rows():
+    encodings = _encodings(4)
+    packed = [pack_encoding(encoding) for encoding in encodings]
+    matrix = unpack_many(packed)
+    assert matrix.shape == (4, 128) and matrix.dtype == np.float64
+    np.testing.assert_allclose(matrix, encodings, rtol=1e-6)
+
+    # A partly migrated database: legacy pickles, float32 and float64 packed rows
+    mixed = [pickle.dumps(encodings[0]), packed[1], pack_encoding(encodings[2], dtype=np.float64), packed[3]]
+    matrix = unpack_many(mixed)
+    assert matrix.shape == (4, 128)
+    assert np.array_equal(matrix[0], encodings[0]) and np.array_equal(matrix[2], encodings[2])
+    np.testing.assert_allclose(matrix, encodings, rtol=1e-6)
+
+    assert unpack_many([]).shape == (0, 128)
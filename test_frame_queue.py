@@ -0,0 +1,53 @@
+import pytest
+from frame_queue import DROP_NEWEST, DROP_OLDEST, KEEP_EVERY_NTH, FrameQueues, FrameSlot
+
+
+def test_drop_oldest_keeps_the_latest_frames():
+    slot = FrameSlot(depth=2, policy=DROP_OLDEST)
+    assert all(slot.put(frame) for frame in range(5))
+    assert list(slot.frames) == [3, 4]
+    assert slot.stats() == {'queued': 2, 'received': 5, 'dropped': 3, 'processed': 0}
+
+
+def test_drop_newest_rejects_frames_while_full():
+    slot = FrameSlot(depth=2, policy=DROP_NEWEST)
+    assert [slot.put(frame) for frame in range(5)] == [True, True, False, False, False]
+    assert list(slot.frames) == [0, 1]
+    assert slot.stats()['dropped'] == 3
+
+
+def test_keep_every_nth_counts_across_calls():
+    slot = FrameSlot(depth=1, policy=KEEP_EVERY_NTH, every_nth=3)
+    admitted = [frame for frame in range(7) if slot.put(frame)]
+    assert admitted == [0, 3, 6]
+    # Admitted frames still supersede each other when the slot is full
+    assert list(slot.frames) == [6]
+    assert slot.stats()['dropped'] == 6
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        FrameSlot(policy='drop_random')
+
+
+def test_cameras_are_isolated_and_served_round_robin():
+    queues = FrameQueues(depth=1, policy=DROP_OLDEST,
+                         camera_policies={'cam2': {'policy': KEEP_EVERY_NTH, 'every_nth': 2}})
+    for frame in range(3):
+        queues.put('cam1', f"cam1-{frame}")
+        queues.put('cam2', f"cam2-{frame}")
+    queues.put('cam3', 'cam3-0')
+
+    assert queues.stats('cam1') == {'queued': 1, 'received': 3, 'dropped': 2, 'processed': 0}
+    assert queues.stats('cam2') == {'queued': 1, 'received': 3, 'dropped': 2, 'processed': 0}
+    assert queues.stats('cam3') == {'queued': 1, 'received': 1, 'dropped': 0, 'processed': 0}
+    assert [queues.get(timeout=0) for _ in range(3)] == [('cam1', 'cam1-2'), ('cam2', 'cam2-2'),
+                                                          ('cam3', 'cam3-0')]
+    assert queues.get(timeout=0) is None
+    assert queues.stats('cam1')['processed'] == 1
+
+
+def test_get_returns_none_once_closed():
+    queues = FrameQueues()
+    queues.close()
+    assert queues.get() is None
@@ -0,0 +1,55 @@
+import sqlite3
+import numpy as np
+from database import init_db
+from encoding_format import pack_encoding
+from gallery import FaceGallery
+
+
+def _enroll(db_path, name, encodings):
+    # What add_record commits before it calls gallery.add_person
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO known_faces (name, age, city, category, details) VALUES (?, 30, 'Pune', 'other', '')",
+                   (name,))
+    person_id = cursor.lastrowid
+    cursor.executemany("INSERT INTO face_encodings (person_id, encoding) VALUES (?, ?)",
+                       [(person_id, pack_encoding(encoding)) for encoding in encodings])
+    conn.commit()
+    conn.close()
+    return person_id
+
+
+def _gallery(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    init_db()
+    rng = np.random.default_rng(0)
+    _enroll('record.db', 'first', rng.normal(0, 0.1, (2, 128)))
+    gallery = FaceGallery('record.db')
+    gallery.reload()
+    return gallery, rng
+
+
+def test_enrollment_is_appended_once_and_keeps_the_gallery_current(tmp_path, monkeypatch):
+    gallery, rng = _gallery(tmp_path, monkeypatch)
+    encodings = rng.normal(1, 0.1, (3, 128))
+    person_id = _enroll('record.db', 'second', encodings)
+    gallery.add_person(person_id, 'second', 'other', encodings)
+
+    assert len(gallery) == 5
+    assert gallery.version == gallery._db_version()
+    assert gallery.refresh_if_stale(0) is False
+
+
+def test_reload_between_commit_and_add_person_does_not_duplicate_rows(tmp_path, monkeypatch):
+    gallery, rng = _gallery(tmp_path, monkeypatch)
+    encodings = rng.normal(1, 0.1, (3, 128))
+    person_id = _enroll('record.db', 'second', encodings)
+    # The background refresher sees the new version before add_person runs
+    assert gallery.refresh_if_stale(0)
+    gallery.add_person(person_id, 'second', 'other', encodings)
+
+    assert len(gallery) == 5
+    assert int(np.sum(gallery.person_ids == person_id)) == 3
+    results, _ = gallery.match(encodings[:1], top_k=3)
+    candidates = [candidate_id for candidate_id, _ in results[0]['candidates']]
+    assert candidates.count(person_id) == 1
@@ -0,0 +1,35 @@
+import numpy as np
+from face_index import IVFIndex
+from matcher import match_faces
+
+
+def _two_people():
+    rng = np.random.default_rng(0)
+    centers = np.zeros((2, 128))
+    centers[1, 0] = 2.0
+    encodings = np.vstack([center + rng.normal(0, 0.01, (4, 128)) for center in centers])
+    person_ids = np.repeat([1, 2], 4)
+    return encodings, person_ids
+
+
+def test_exact_match_reports_runner_up_margin():
+    encodings, person_ids = _two_people()
+    results = match_faces(encodings[:1], encodings, person_ids, top_k=3)
+    assert results[0]['matched'] and results[0]['person_id'] == 1
+    assert [person for person, _ in results[0]['candidates']] == [1, 2]
+    assert 1.5 < results[0]['margin'] < 2.5
+
+
+def test_sparse_ivf_result_with_one_candidate():
+    # Each person gets their own list and n_probe=1 only visits one, so both
+    # people are found across the batch but each probe's row holds a single
+    # finite candidate
+    encodings, person_ids = _two_people()
+    index = IVFIndex(n_lists=2, n_probe=1)
+    index.build(encodings)
+    for top_k in (1, 3):
+        results = match_faces(encodings[[0, 4]], encodings, person_ids, top_k=top_k, index=index)
+        for result, person_id in zip(results, [1, 2]):
+            assert result['matched'] and result['person_id'] == person_id
+            assert result['candidates'] == [(person_id, result['distance'])]
+            assert result['margin'] == float('inf')
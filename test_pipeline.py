@@ -0,0 +1,95 @@
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('dlib')
+pytest.importorskip('face_recognition')
+
+from pipeline import RecognitionPipeline
+from recognition import skipped_analysis
+from sightings import SightingAggregator
+
+
+class _Gallery:
+    """Matches every probe to person 7"""
+
+    def match(self, probes, top_k=3, tolerance=0.6):
+        results = [{'matched': True, 'person_id': 7, 'distance': 0.3, 'margin': 0.2, 'candidates': [(7, 0.3)]}
+                   for _ in probes]
+        return results, {7: {'name': 'Jane Doe', 'category': 'missing person'}}
+
+
+class _Writer:
+    def __init__(self):
+        self.opened = 0
+
+    def open_sighting(self, sighting, frame):
+        self.opened += 1
+
+    def update_sighting(self, sighting, frame=None):
+        pass
+
+    def close(self):
+        pass
+
+
+def _detected_analysis(camera_id):
+    analysis = skipped_analysis(camera_id)
+    analysis.update(skipped=False, locations=[(10, 60, 60, 10)], track_ids=[None], encoded=[0],
+                    encodings=np.zeros((1, 128)))
+    return analysis
+
+
+def test_motion_gated_frames_keep_the_sighting_open():
+    # Forced detections every 0.3 s but a 0.1 s sighting gap: without the
+    # skipped frames reporting the carried-over face, every forced
+    # detection would open a new sighting
+    writer = _Writer()
+    sightings = SightingAggregator(writer, gap=0.1, sweep_interval=0.02)
+    evidence = []
+
+    def on_detection(name, category, frame, location, person_id=None, distance=None):
+        evidence.append(frame)
+        sightings.observe(person_id, name, category, location, frame, distance)
+
+    pipeline = RecognitionPipeline(_Gallery(), on_detection)
+    for second in range(3):
+        pipeline._publish('cam1', _detected_analysis('cam1'), None, time.time(), jpeg_bytes=b'detected')
+        for _ in range(6):
+            time.sleep(0.05)
+            result = pipeline._publish('cam1', skipped_analysis('cam1'), None, time.time(), jpeg_bytes=b'skipped')
+            assert result['skipped'] and result['detected_info'][0]['person_id'] == 7
+    sightings.close()
+
+    assert writer.opened == 1
+    assert evidence.count(b'skipped') == 18
+
+
+def test_worker_restart_only_forgets_its_own_cameras():
+    from concurrent.futures.process import BrokenProcessPool
+
+    pipeline = RecognitionPipeline(_Gallery(), lambda *args, **kwargs: None, workers=2)
+    cameras = [f"cam{i}" for i in range(8)]
+    pipeline.start()
+    crashed = pipeline._lanes[0]
+    assert {pipeline._lane_for(camera)['id'] for camera in cameras} == {0, 1}
+    for camera in cameras:
+        pipeline.track_identities[camera] = {1: {'person_id': 7}}
+
+    class _Broken:
+        def submit(self, *args):
+            raise BrokenProcessPool()
+
+        def shutdown(self):
+            pass
+
+    pipeline._new_executor = _Broken
+    crashed['executor'] = _Broken()
+    crashed['frames'].put('probe', (b'', None, time.time()))
+    expected = {camera for camera in cameras if pipeline._lane_for(camera) is not crashed}
+    deadline = time.monotonic() + 5
+    while set(pipeline.track_identities) != expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pipeline.shutdown()
+
+    assert set(pipeline.track_identities) == expected
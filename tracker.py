@@ -0,0 +1,117 @@
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of two lists of (top, right, bottom, left) boxes"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+def centroid_distance(boxes_a, boxes_b):
+    """Pairwise centroid distance, in units of the first box's width"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    centers_a = np.stack([(a[:, 1] + a[:, 3]) / 2, (a[:, 0] + a[:, 2]) / 2], axis=1)
+    centers_b = np.stack([(b[:, 1] + b[:, 3]) / 2, (b[:, 0] + b[:, 2]) / 2], axis=1)
+    widths = np.maximum(a[:, 1] - a[:, 3], 1.0)
+    return np.linalg.norm(centers_a[:, None, :] - centers_b[None, :, :], axis=2) / widths[:, None]
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.missed = 0
+        self.frames_since_encoding = 0
+
+
+class FaceTracker:
+    """Associates face boxes across frames of one camera.
+
+    Boxes are matched to existing tracks greedily by IoU, falling back to
+    centroid distance for faces that moved quickly. A face only needs a new
+    128-d encoding when its track is new or every `reverify_every` frames;
+    otherwise the track's identity from the last encoding is reused.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_centroid_distance=0.5, max_missed=5, reverify_every=15):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_missed = max_missed
+        self.reverify_every = reverify_every
+        self.tracks = []
+        self.next_id = 1
+
+    def _associate(self, locations):
+        pairs = []
+        if not self.tracks or not locations:
+            return pairs
+        track_boxes = [track.box for track in self.tracks]
+        iou = box_iou(track_boxes, locations)
+        distance = centroid_distance(track_boxes, locations)
+        # Higher is better: IoU first, close centroids as a weaker fallback
+        score = np.where(iou >= self.iou_threshold, 1.0 + iou,
+                         np.where(distance <= self.max_centroid_distance, 1.0 - distance, 0.0))
+        used_tracks, used_boxes = set(), set()
+        for flat in np.argsort(-score, axis=None):
+            t, d = np.unravel_index(flat, score.shape)
+            if score[t, d] <= 0:
+                break
+            if t in used_tracks or d in used_boxes:
+                continue
+            used_tracks.add(t)
+            used_boxes.add(d)
+            pairs.append((t, d))
+        return pairs
+
+    def update(self, locations):
+        """Feed one frame's face boxes.
+
+        Returns (track_ids, needs_encoding, ended_ids): a track id per box,
+        the indices of boxes that must be encoded this frame, and the ids of
+        tracks that disappeared.
+        """
+        locations = [tuple(int(v) for v in box) for box in locations]
+        track_ids = [None] * len(locations)
+        needs_encoding = []
+        matched_tracks = set()
+
+        for t, d in self._associate(locations):
+            track = self.tracks[t]
+            track.box = locations[d]
+            track.missed = 0
+            track.frames_since_encoding += 1
+            track_ids[d] = track.id
+            matched_tracks.add(t)
+            if track.frames_since_encoding >= self.reverify_every:
+                track.frames_since_encoding = 0
+                needs_encoding.append(d)
+
+        survivors, ended = [], []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    ended.append(track.id)
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        for d, box in enumerate(locations):
+            if track_ids[d] is None:
+                track = Track(self.next_id, box)
+                self.next_id += 1
+                self.tracks.append(track)
+                track_ids[d] = track.id
+                needs_encoding.append(d)
+
+        return track_ids, sorted(needs_encoding), ended